@@ -0,0 +1,175 @@
+"""
+Cold-start import budget for the Cloud Functions in main.py.
+
+Every function instance imports main.py, then whatever modules its endpoint imports on
+first call. This script measures that cost per endpoint, each in a fresh interpreter,
+and fails if an endpoint is over budget, has no budget, or if main.py itself loads a
+heavy dependency. Each endpoint's first-call imports are read from main.py's source, so
+a new function or a changed import is picked up without editing this file.
+
+Needs the same setup as the emulator (functions/.env and ../service-account.json, or
+application default credentials), since importing main.py initializes firebase-admin.
+
+Usage:
+    python cold_start_budget.py            # all endpoints
+    python cold_start_budget.py --runs 5   # best of 5 fresh interpreters per endpoint
+"""
+import ast
+import json
+import os
+import subprocess
+import sys
+
+# Must never be loaded just by importing main.py
+HEAVY_MODULES = ["pandas", "numpy", "requests", "hdforce"]
+
+# Budgets in milliseconds for `import main` plus the endpoint's first-call imports
+ENTRY_BUDGET_MS = 1500
+LIGHT_BUDGET_MS = 2000
+ANALYTICS_BUDGET_MS = 3000
+JOB_BUDGET_MS = 4000
+
+# Budget per endpoint. Every Cloud Function in main.py must be listed; the modules each
+# one imports on first call are read from main.py itself (see first_call_imports).
+BUDGETS = {
+    # Testing-station data entry: firebase only
+    "submit_standing_reach": ENTRY_BUDGET_MS,
+    "get_standing_reach": ENTRY_BUDGET_MS,
+    "submit_vertical_jump": ENTRY_BUDGET_MS,
+    "submit_broad_jump": ENTRY_BUDGET_MS,
+    "set_user_role": ENTRY_BUDGET_MS,
+    "admin_create_user": ENTRY_BUDGET_MS,
+    "update_athlete_info": ENTRY_BUDGET_MS,
+    # Lightweight reads, roster edits and the roster/metric triggers
+    "get_roster": LIGHT_BUDGET_MS,
+    "register_athlete": LIGHT_BUDGET_MS,
+    "upload_roster_csv": LIGHT_BUDGET_MS,
+    "get_valor_athletes": LIGHT_BUDGET_MS,
+    "on_athlete_info_written": LIGHT_BUDGET_MS,
+    "on_sprint40_written": LIGHT_BUDGET_MS,
+    "on_pro_agility_written": LIGHT_BUDGET_MS,
+    "on_standing_vert_written": LIGHT_BUDGET_MS,
+    "on_broad_jump_written": LIGHT_BUDGET_MS,
+    "on_standing_reach_written": LIGHT_BUDGET_MS,
+    # Ranking / analytics
+    "get_athlete_metrics": ANALYTICS_BUDGET_MS,
+    "get_athlete_metrics_batch": ANALYTICS_BUDGET_MS,
+    "get_athlete_scorecards": ANALYTICS_BUDGET_MS,
+    # Background jobs and their admin-triggered run_* twins
+    "sync_bookeo_roster": JOB_BUDGET_MS,
+    "validate_external_links": JOB_BUDGET_MS,
+    "run_link_validation": JOB_BUDGET_MS,
+    "sync_hd_tests": JOB_BUDGET_MS,
+    "run_hd_sync": JOB_BUDGET_MS,
+    "sync_valor_sessions": JOB_BUDGET_MS,
+    "run_valor_sync": JOB_BUDGET_MS,
+    "prewarm_event": JOB_BUDGET_MS,
+    "run_prewarm": JOB_BUDGET_MS,
+}
+
+# (module, name) imported in main.py -> modules that name loads on first call inside its
+# own module, which main.py's source doesn't show
+DEEP_IMPORTS = {
+    ("func_bookeo", "get_bookings"): ["func_clients"],
+    ("func_links", "validate_links"): ["func_clients", "hdforce"],
+    ("func_hd", "athlete_roster"): ["func_clients", "hdforce"],
+    ("func_hd", "sync_tests"): ["hdforce"],
+    ("func_valor", "athlete_roster"): ["func_clients"],
+    ("func_valor", "sync_sessions"): ["func_clients"],
+    ("func_valor", "report_summaries"): ["func_clients"],
+}
+
+# Decorator namespaces that mark a module-level function in main.py as a Cloud Function
+_TRIGGER_MODULES = {"https_fn", "scheduler_fn", "firestore_fn"}
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def first_call_imports() -> dict[str, list[str]]:
+    """endpoint -> modules it imports on first call, read from main.py's source.
+
+    Covers imports inside the endpoint and inside any main.py helper it references
+    (safe_execute, _run_hd_sync, ...), so the list can't drift from the code.
+    """
+    with open(os.path.join(_HERE, "main.py")) as f:
+        tree = ast.parse(f.read())
+    functions = {n.name: n for n in tree.body if isinstance(n, ast.FunctionDef)}
+
+    def is_endpoint(fn) -> bool:
+        return any(isinstance(d, ast.Call) and isinstance(d.func, ast.Attribute)
+                   and getattr(d.func.value, "id", None) in _TRIGGER_MODULES for d in fn.decorator_list)
+
+    def imports_of(name: str, seen: set) -> list[str]:
+        if name in seen:
+            return []
+        seen.add(name)
+        modules = []
+        for node in ast.walk(functions[name]):
+            if isinstance(node, ast.Import):
+                modules += [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0:
+                modules.append(node.module)
+                for alias in node.names:
+                    modules += DEEP_IMPORTS.get((node.module, alias.name), [])
+            elif isinstance(node, ast.Name) and node.id in functions:
+                modules += imports_of(node.id, seen)
+        return modules
+
+    endpoints = {}
+    for name, fn in functions.items():
+        if is_endpoint(fn):
+            endpoints[name] = list(dict.fromkeys(imports_of(name, set())))
+    return endpoints
+
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import main
+t_main = time.perf_counter()
+heavy = [m for m in {heavy!r} if m in sys.modules]
+for name in {modules!r}:
+    __import__(name)
+t_end = time.perf_counter()
+print(json.dumps({{"main_ms": (t_main - t0) * 1000, "total_ms": (t_end - t0) * 1000, "heavy_at_load": heavy}}))
+"""
+
+
+def measure(modules: list[str]) -> dict:
+    """Import main.py and `modules` in a fresh interpreter and report timings."""
+    code = _PROBE.format(heavy=HEAVY_MODULES, modules=modules)
+    out = subprocess.run([sys.executable, "-c", code], cwd=_HERE,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[sys.argv.index("--runs") + 1]) if "--runs" in sys.argv else 3
+    endpoints = first_call_imports()
+    failures = [e for e in endpoints if e not in BUDGETS]
+    for endpoint in failures:
+        print(f"{endpoint}: no entry in BUDGETS")
+    for endpoint in BUDGETS.keys() - endpoints.keys():
+        print(f"{endpoint}: in BUDGETS but not a function in main.py")
+    print(f"{'endpoint':<28}{'main ms':>10}{'total ms':>10}{'budget':>10}")
+    for endpoint, modules in endpoints.items():
+        budget = BUDGETS.get(endpoint)
+        if budget is None:
+            continue
+        # Best of N: the first run also pays for a cold filesystem cache
+        best = min((measure(modules) for _ in range(runs)), key=lambda r: r["total_ms"])
+        flag = ""
+        if best["total_ms"] > budget:
+            flag = "  OVER BUDGET"
+            failures.append(endpoint)
+        if best["heavy_at_load"]:
+            flag += f"  main.py loaded {', '.join(best['heavy_at_load'])}"
+            failures.append(endpoint)
+        print(f"{endpoint:<28}{best['main_ms']:>10.0f}{best['total_ms']:>10.0f}{budget:>10}{flag}")
+    if failures:
+        print(f"\n{len(set(failures))} endpoint(s) outside their cold-start budget.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
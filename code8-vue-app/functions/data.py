@@ -5,6 +5,7 @@ from functions.db_client import GetSupaTableCached
 from hdforce import AuthManager, GetTests, GetAthletes
 from functions.func_swift import ProAgilityData, Sprint40Data, VertJumpData, BroadJumpData
 from functions.func_player_info import AthleteSignUpData
+from functions.func_percentiles import PercentileTable
 import views.valor_data as valor
 
 
@@ -33,6 +34,10 @@ except Exception as e:
     st.error(f"Failed to load Combine Percentiles table: {e}")
     CombinePercentiles = pd.DataFrame()
 
+# Compiled once so every ranking below is a single vectorized lookup
+ForcePlateTable = PercentileTable(ForcePlatePercentiles)
+CombineTable = PercentileTable(CombinePercentiles)
+
 # Athlete Sign Up Data -----
 try:
     dfAthleteSignUp = AthleteSignUpData()
@@ -201,16 +206,6 @@ def AthleteCMJ(athlete: str, cmj_data = HawkinCMJ()):
         pd.DataFrame: Filtered DataFrame for the specified athlete.
     """
     if athlete and not cmj_data.empty:
-        # Function to get external percentile using interpolation
-        def get_external_percentile(value, metric_col):
-            import numpy as np
-            ref_df = ForcePlatePercentiles.dropna(subset=[metric_col, "Percentile"]).sort_values(by=metric_col)
-            if ref_df.empty:
-                return None
-            # Use interpolation to get exact percentile for the athlete's value
-            percentile = np.interp(value, ref_df[metric_col].values, ref_df["Percentile"].values)
-            return percentile
-        
         # Create DataFrame with all data first to calculate population-based percentiles
         data = pd.DataFrame({
             "Date-Time": pd.to_datetime(cmj_data["timestamp"], unit='s').dt.strftime("%Y-%m-%d %H:%M:%S"),
@@ -218,16 +213,16 @@ def AthleteCMJ(athlete: str, cmj_data = HawkinCMJ()):
             "Athlete Name": cmj_data["athlete_name"],
             "Jump Height (in)": cmj_data["jump_height_m"] * 39.3701,  # Convert meters to inches
             "Jump Height SLO Rank": cmj_data["jump_height_m"].rank(method='average', ascending=True, na_option='keep', pct=True) * 100,
-            "Jump Height Elite Rank": cmj_data["jump_height_m"].apply(lambda x: get_external_percentile(x, "JumpHeight")),
+            "Jump Height Elite Rank": ForcePlateTable.rank("JumpHeight", cmj_data["jump_height_m"].values),
             "mRSI": cmj_data["mrsi"],
             "mRSI SLO Rank": cmj_data["mrsi"].rank(method='average', ascending=True, na_option='keep', pct=True) * 100,
-            "mRSI Elite Rank": cmj_data["mrsi"].apply(lambda x: get_external_percentile(x, "mRSI")),
+            "mRSI Elite Rank": ForcePlateTable.rank("mRSI", cmj_data["mrsi"].values),
             "Peak Rel Prop Power (W/kg)": cmj_data["peak_relative_propulsive_power_w_kg"],
             "Peak Rel Power SLO Rank": cmj_data["peak_relative_propulsive_power_w_kg"].rank(method='average', ascending=True, na_option='keep', pct=True) * 100,
-            "Peak Rel Power Elite Rank": cmj_data["peak_relative_propulsive_power_w_kg"].apply(lambda x: get_external_percentile(x, "PeakRelPropPower")),
+            "Peak Rel Power Elite Rank": ForcePlateTable.rank("PeakRelPropPower", cmj_data["peak_relative_propulsive_power_w_kg"].values),
             "Braking Asymmetry": cmj_data["lr_braking_impulse_index"].round(0),
             "Asymmetry SLO Rank": (1 - cmj_data["lr_braking_impulse_index"].rank(method='average', ascending=False, na_option='keep', pct=True)) * 100,  # Lower asymmetry is better
-            "Asymmetry Elite Rank": cmj_data["lr_braking_impulse_index"].apply(lambda x: get_external_percentile(x, "BrakingAsymm")),
+            "Asymmetry Elite Rank": ForcePlateTable.rank("BrakingAsymm", cmj_data["lr_braking_impulse_index"].values),
         })
 
         # Now filter for the specific athlete
@@ -281,8 +276,6 @@ def AthleteMR(athlete: str, mr_data = HawkinMR()):
 
 # Define updated versions of the swiftSprint and proAgility functions with percentile logic
 def swiftSprint(data, player_name):
-    external_percentiles = CombinePercentiles
-
     data.columns = data.columns.str.strip()
     split_time_pivot = data.pivot(index=["Name", "ActivityIdentifier"], columns="Distance", values="Split")
     total_time_pivot = data.pivot(index=["Name", "ActivityIdentifier"], columns="Distance", values="Total")
@@ -293,13 +286,6 @@ def swiftSprint(data, player_name):
     df_all["perc_40yd"] = (1 - df_all["total_time_40yd"].rank(pct=True)) * 100
     df_all["perc_10yd"] = (1 - df_all["total_time_10yd"].rank(pct=True)) * 100
 
-    def get_external_percentile(time_val, col):
-        #.reset_index(drop=True)
-        match = ref_df[ref_df[col] >= time_val]
-        if match.empty:
-            return 0
-        return match.iloc[0]["Percentile"]
-
     df_out = df_all[df_all["Name"] == player_name].copy()
 
     # Get best rep for 40yd
@@ -308,17 +294,9 @@ def swiftSprint(data, player_name):
     # filter to best rep
     df_out = df_out[df_out["total_time_40yd"] == best_rep].copy()
 
-    # Get external percentile
-    ref_df = external_percentiles.sort_values(by="Sprint40", ascending=True)
+    # Get external percentile: first reference row at or slower than the best rep
+    df_out["ext_perc_40yd"] = CombineTable.rank("Sprint40", [best_rep], method="step", missing=0)[0]
 
-    # Match the best rep to the reference DataFrame
-    match = ref_df[ref_df["Sprint40"] >= best_rep]
-    
-    if match.empty:
-        df_out["ext_perc_40yd"] = 0
-    else:
-        df_out["ext_perc_40yd"] = match.iloc[0]["Percentile"]
-   
     return df_out
 
 
@@ -328,8 +306,6 @@ def swiftSprint(data, player_name):
 
 ## Individual Pro Agility Data
 def proAgility(data, player_name):
-    external_percentiles = CombinePercentiles
-
     data.columns = data.columns.str.strip()
     # Check if the player exists in the data
     if data.empty:
@@ -358,17 +334,8 @@ def proAgility(data, player_name):
         # filter to best rep
         df_out = df_out[df_out["total_time"] == best_rep].copy()
 
-        # Get external percentile
-        ref_df = external_percentiles.sort_values(by="ProAgility", ascending=True)
-
-        # Match the best rep to the reference DataFrame
-        match = ref_df[ref_df["ProAgility"] >= best_rep]
-
-        print(match)
-        if match.empty:
-            df_out["ext_perc_proAgility"] = 0
-        else:
-            df_out["ext_perc_proAgility"] = match.iloc[0]["Percentile"]
+        # Get external percentile: first reference row at or slower than the best rep
+        df_out["ext_perc_proAgility"] = CombineTable.rank("ProAgility", [best_rep], method="step", missing=0)[0]
 
     return df_out
 
@@ -399,18 +366,9 @@ def verticalJump(player_name=None):
     # Calculate external percentiles
     if df_all.empty:
         return pd.DataFrame()
-    
-    external_percentiles = CombinePercentiles
-
-    def get_external_percentile(val, col):
-        ref_df = external_percentiles.sort_values(by=col, ascending=True).reset_index(drop=True)
-        match = ref_df[ref_df[col] >= val]
-        if match.empty:
-            return 100
-        return match.iloc[0]["Percentile"]
-    
+
     df_out = df_all[df_all["Name"] == player_name].copy()
-    df_out["ext_perc_vert"] = df_out["VerticalJump"].apply(lambda x: get_external_percentile(x, "VerticalJump"))
+    df_out["ext_perc_vert"] = CombineTable.rank("VerticalJump", df_out["VerticalJump"].values, method="step", missing=100)
 
     return df_out
 
@@ -439,17 +397,8 @@ def broadJump(player_name=None):
     df.columns = df.columns.str.strip()
     df_all = df[["Name", "BestBroadJump", "perc_broad"]].copy()
 
-    external_percentiles = CombinePercentiles
-
-    def get_external_percentile(val, col):
-        ref_df = external_percentiles.sort_values(by=col, ascending=True).reset_index(drop=True)
-        match = ref_df[ref_df[col] >= val]
-        if match.empty:
-            return 100
-        return match.iloc[0]["Percentile"]
-    
     df_out = df_all[df_all["Name"] == player_name].copy()
-    df_out["ext_perc_broad"] = df_out["BestBroadJump"].apply(lambda x: get_external_percentile(x, "BroadJump"))
+    df_out["ext_perc_broad"] = CombineTable.rank("BroadJump", df_out["BestBroadJump"].values, method="step", missing=100)
 
     return df_out
 
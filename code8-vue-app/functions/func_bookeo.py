@@ -1,5 +1,4 @@
 import os
-import requests
 
 BOOKEO_BASE = "https://api.bookeo.com/v2"
 
@@ -23,13 +22,15 @@ def get_bookings(product_id: str, start_time: str, end_time: str) -> list[dict]:
         "itemsPerPage": 50,
     }
 
+    from func_clients import clients
+
     all_bookings = []
     page_token = None
 
     while True:
         if page_token:
             params["pageNavigationToken"] = page_token
-        resp = requests.get(f"{BOOKEO_BASE}/bookings", params=params, timeout=30)
+        resp = clients.session("bookeo").get(f"{BOOKEO_BASE}/bookings", params=params, timeout=30)
         resp.raise_for_status()
         body = resp.json()
 
@@ -0,0 +1,200 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from urllib.parse import quote
+
+# Shared tier for SharedCache: one doc per key in this collection, or files under
+# SHARED_CACHE_DIR (defaults to a temp dir when running in the Functions emulator)
+SHARED_CACHE = "upstream_cache"
+
+
+class TTLCache:
+    """Thread-safe in-process cache with TTL, LRU size bound and single-flight loads.
+
+    Cloud Function instances may serve several requests at once, so a cold key must not
+    send every concurrent request upstream. get_or_load() takes a per-key lock: the first
+    caller runs the loader while the others wait and then read what it stored. Loader
+    errors are not cached; the next waiter retries.
+    """
+
+    def __init__(self, ttl: float | None = None, maxsize: int = 128):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._key_locks = {}  # key -> [lock, waiter count]
+
+    def _lookup(self, key):
+        # Caller holds self._lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def get(self, key, default=None):
+        with self._lock:
+            hit, value = self._lookup(key)
+        return value if hit else default
+
+    def set(self, key, value, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, key, loader, ttl: float | None = None):
+        """Cached value for `key`, or loader() run once across concurrent callers."""
+        with self._lock:
+            hit, value = self._lookup(key)
+            if hit:
+                return value
+            slot = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            slot[1] += 1
+        try:
+            with slot[0]:
+                # Another caller may have filled the key while we waited
+                with self._lock:
+                    hit, value = self._lookup(key)
+                if hit:
+                    return value
+                value = loader()
+                self.set(key, value, ttl)
+                return value
+        finally:
+            with self._lock:
+                slot[1] -= 1
+                if slot[1] == 0 and self._key_locks.get(key) is slot:
+                    del self._key_locks[key]
+
+    def invalidate(self, key=None):
+        """Drop one key, or everything when called without a key."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+def _shared_dir() -> str | None:
+    path = os.environ.get("SHARED_CACHE_DIR", "").strip().strip("\"'")
+    if path:
+        return path
+    if os.environ.get("FUNCTIONS_EMULATOR") == "true":
+        return os.path.join(tempfile.gettempdir(), "slo-combine-cache")
+    return None
+
+
+class SharedCache:
+    """Two-tier cache for expensive upstream pulls: instance memory, then a shared store.
+
+    Instances don't share memory, so a cold one would otherwise repeat multi-second HD /
+    Valor calls. L1 is a TTLCache; L2 is a zlib-compressed JSON payload with an absolute
+    expiry, kept in the upstream_cache collection (or a local directory in emulator/test
+    mode). A miss in both runs the loader once per instance and writes both tiers.
+    Values must be JSON-serializable.
+    """
+
+    def __init__(self, namespace: str, ttl: float, maxsize: int = 32):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._memory = TTLCache(ttl=ttl, maxsize=maxsize)
+
+    def _doc_id(self, key) -> str:
+        return quote(f"{self.namespace}:{key}", safe="")
+
+    def _read_shared(self, db, key):
+        """(expires_at, value) from L2, or None on a miss / expired / unreadable entry."""
+        directory = _shared_dir()
+        try:
+            if directory:
+                path = os.path.join(directory, self._doc_id(key))
+                if not os.path.exists(path):
+                    return None
+                with open(path, "rb") as f:
+                    entry = json.loads(zlib.decompress(f.read()))
+                expires_at, value = entry["expires_at"], entry["value"]
+            else:
+                snap = db.collection(SHARED_CACHE).document(self._doc_id(key)).get()
+                if not snap.exists:
+                    return None
+                d = snap.to_dict() or {}
+                expires_at, value = d.get("expires_at", 0), json.loads(zlib.decompress(d["payload"]))
+        except Exception as e:
+            print(f"Shared cache read failed for {self.namespace}:{key}: {e}")
+            return None
+        return (expires_at, value) if time.time() < expires_at else None
+
+    def _write_shared(self, db, key, expires_at: float, value):
+        directory = _shared_dir()
+        try:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+                path = os.path.join(directory, self._doc_id(key))
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(zlib.compress(json.dumps({"expires_at": expires_at, "value": value}).encode("utf-8")))
+                os.replace(tmp, path)
+            else:
+                from firebase_admin import firestore
+                payload = zlib.compress(json.dumps(value).encode("utf-8"))
+                db.collection(SHARED_CACHE).document(self._doc_id(key)).set({
+                    "namespace": self.namespace,
+                    "payload": payload,
+                    "size": len(payload),
+                    "expires_at": expires_at,
+                    "stored_at": firestore.SERVER_TIMESTAMP,
+                })
+        except Exception as e:
+            # The shared tier is an optimization; the caller still gets the fresh value
+            print(f"Shared cache write failed for {self.namespace}:{key}: {e}")
+
+    def get_or_load(self, db, key, loader, refresh: bool = False):
+        """Value for `key` from L1, then L2, then loader(). refresh=True skips both tiers."""
+        def load():
+            if not refresh:
+                entry = self._read_shared(db, key)
+                if entry is not None:
+                    return entry
+            value = loader()
+            expires_at = time.time() + self.ttl
+            self._write_shared(db, key, expires_at, value)
+            return expires_at, value
+
+        if refresh:
+            self._memory.invalidate(key)
+        expires_at, value = self._memory.get_or_load(key, load)
+        if time.time() >= expires_at:
+            # Warmed from an L2 entry that has since expired
+            self._memory.invalidate(key)
+            expires_at, value = self._memory.get_or_load(key, load)
+        return value
+
+    def invalidate(self, db, key):
+        """Drop `key` from both tiers."""
+        self._memory.invalidate(key)
+        directory = _shared_dir()
+        try:
+            if directory:
+                path = os.path.join(directory, self._doc_id(key))
+                if os.path.exists(path):
+                    os.remove(path)
+            else:
+                db.collection(SHARED_CACHE).document(self._doc_id(key)).delete()
+        except Exception as e:
+            print(f"Shared cache delete failed for {self.namespace}:{key}: {e}")
@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import func_trace
+
+
+def _env(name: str) -> str:
+    return os.environ.get(name, "").strip().strip("\"'")
+
+
+class ClientManager:
+    """Per-instance owner of upstream credentials and HTTP sessions.
+
+    Cloud Function instances serve many requests, so the Valor Cognito token, the Hawkin
+    Dynamics AuthManager login and the keep-alive sessions are created once and reused
+    until shortly before they expire. Refreshes happen under a lock so concurrent requests
+    on the same instance trigger a single login.
+    """
+
+    # Refresh this many seconds before the upstream says a credential expires
+    EXPIRY_MARGIN = 120
+    # hdforce manages its own access token; re-run AuthManager on this cadence to be safe
+    HD_AUTH_TTL = 50 * 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._valor_lock = threading.Lock()
+        self._hd_lock = threading.Lock()
+        self._sessions = {}
+        self._valor_token = None
+        self._valor_expires_at = 0.0
+        self._hd_authed_at = None
+
+    def session(self, name: str, retries: int = 2, pool_size: int = 10) -> requests.Session:
+        """Shared keep-alive session for one upstream, with retry/backoff on transient errors."""
+        with self._lock:
+            session = self._sessions.get(name)
+            if session is None:
+                retry = Retry(
+                    total=retries,
+                    backoff_factor=0.5,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    allowed_methods=["GET"],
+                )
+                adapter = HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=pool_size)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[name] = session
+            return session
+
+    def valor_token(self) -> str | None:
+        """Valor Cognito IdToken, reused until shortly before it expires."""
+        with self._valor_lock:
+            if self._valor_token and time.time() < self._valor_expires_at - self.EXPIRY_MARGIN:
+                return self._valor_token
+
+            payload = {
+                "AuthFlow": "USER_PASSWORD_AUTH",
+                "ClientId": _env("VALOR_CLIENT_ID"),
+                "AuthParameters": {
+                    "USERNAME": _env("VALOR_USER"),
+                    "PASSWORD": _env("VALOR_PASSWORD")
+                }
+            }
+            headers = {
+                "Content-Type": "application/x-amz-json-1.1",
+                "User-Agent": "insomnia/11.3.0",
+                "X-Amz-Target": "AWSCognitoIdentityProviderService.InitiateAuth"
+            }
+
+            response = self.session("cognito").post(_env("VALOR_TOKEN_URL"), json=payload, headers=headers, timeout=30)
+            if response.status_code != 200:
+                print(f"Valor Auth failed: {response.text}")
+                self._valor_token = None
+                return None
+
+            data = response.json().get("AuthenticationResult", {})
+            self._valor_token = data.get("IdToken")
+            self._valor_expires_at = time.time() + float(data.get("ExpiresIn") or 3600)
+            return self._valor_token
+
+    def invalidate_valor_token(self, rejected: str | None = None):
+        """Force the next valor_token() call to log in again (e.g. after a 401).
+
+        With `rejected`, only drop the cached token if it is still that one, so concurrent
+        requests that all got a 401 for the same token trigger a single login.
+        """
+        with self._valor_lock:
+            if rejected is None or self._valor_token == rejected:
+                self._valor_token = None
+
+    def ensure_hd_auth(self) -> bool:
+        """Log hdforce in once per instance (and again after HD_AUTH_TTL). False if no HD token."""
+        hd_token = _env("HD_TOKEN")
+        if not hd_token:
+            return False
+        with self._hd_lock:
+            if self._hd_authed_at is None or time.time() - self._hd_authed_at > self.HD_AUTH_TTL:
+                from hdforce import AuthManager
+                AuthManager(authMethod="manual", refreshToken=hd_token)
+                self._hd_authed_at = time.time()
+        return True
+
+
+clients = ClientManager()
+
+# requests is loaded now; hook it so the current request's upstream calls are traced
+func_trace.instrument()
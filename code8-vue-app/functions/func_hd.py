@@ -1,9 +1,315 @@
-# Hawkin Dynamic Functions for Streamlit App
+# Hawkin Dynamics test sync for the Cloud Functions backend
 
 '''
-
+HD tests are pulled incrementally (by HD sync-time watermark) into the compact `hd_tests`
+collection, one doc per test id with only the columns the app reads. Request paths load
+each test type once per instance into a CompactTests table and look athletes up by
+HawkinID in a dict instead of filtering a whole-event DataFrame.
 '''
-import hdforce as hd
-import pandas as pd
-import matplotlib.pyplot as plt
-import scipy.stats as stats
\ No newline at end of file
+import datetime
+import math
+import os
+
+from func_cache import SharedCache, TTLCache
+
+HD_TESTS = "hd_tests"
+HD_WATERMARK_DOC = ("sync_status", "hd_tests")
+HD_TEST_TYPES = ["CMJ", "MR"]
+# tests_for_athletes answers up to this many HawkinIDs with per-athlete queries
+HD_DIRECT_QUERY_MAX = 5
+
+# Columns kept per test type (everything else GetTests returns is dropped)
+HD_COMMON_COLUMNS = ["athlete_id", "athlete_name", "timestamp"]
+HD_COLUMNS = {
+    "CMJ": ["jump_height_m", "mrsi", "peak_relative_propulsive_power_w_kg", "lr_braking_impulse_index"],
+    "MR": ["number_of_jumps_count", "avg_jump_height_m", "peak_jump_height_m", "avg_rsi", "peak_rsi"],
+}
+
+M_TO_IN = 39.3701
+
+# HD athlete roster (id + name), shared across instances through the upstream_cache tier
+HD_ROSTER_TTL = float(os.environ.get("HD_ROSTER_TTL", "").strip().strip("\"'") or 900)
+_roster_cache = SharedCache("hd", ttl=HD_ROSTER_TTL)
+
+# How long an instance trusts its copy of the sync watermark before re-reading it
+HD_TABLE_CHECK_SECONDS = 60
+# Keyed by (type, watermark) so a sync that brought new tests simply misses
+_tables = TTLCache(maxsize=2 * len(HD_TEST_TYPES))
+_watermark = TTLCache(ttl=HD_TABLE_CHECK_SECONDS, maxsize=1)
+
+
+def event_window() -> tuple[int, int]:
+    """Event test window as epoch seconds, from HD_EVENT_FROM / HD_EVENT_TO (YYYY-MM-DD, inclusive)."""
+    start = os.environ.get("HD_EVENT_FROM", "").strip().strip("\"'") or "2025-07-23"
+    end = os.environ.get("HD_EVENT_TO", "").strip().strip("\"'") or "2025-07-27"
+    start_dt = datetime.datetime.strptime(start, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+    end_dt = datetime.datetime.strptime(end, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc) + datetime.timedelta(days=1)
+    return int(start_dt.timestamp()), int(end_dt.timestamp()) - 1
+
+
+def _clean(v):
+    """Firestore-safe scalar: numpy types unwrapped, NaN/Inf to None."""
+    if hasattr(v, "item"):
+        v = v.item()
+    if isinstance(v, float) and (math.isnan(v) or math.isinf(v)):
+        return None
+    return v
+
+
+def test_records(df, type_id: str) -> dict:
+    """Compact {test_id: record} for one GetTests DataFrame."""
+    if df is None or df.empty or "id" not in df.columns:
+        return {}
+    keep = [c for c in HD_COMMON_COLUMNS + HD_COLUMNS[type_id] if c in df.columns]
+    records = {}
+    for row in df[["id"] + keep].itertuples(index=False):
+        values = dict(zip(["id"] + keep, row))
+        rec = {c: _clean(values[c]) for c in keep}
+        rec["athlete_id"] = str(rec.get("athlete_id")) if rec.get("athlete_id") is not None else None
+        rec["type"] = type_id
+        records[str(values["id"])] = rec
+    return records
+
+
+def _compact_value(v):
+    """float32 / numpy scalar back to a plain JSON value without float32 noise digits."""
+    if hasattr(v, "item"):
+        v = v.item()
+    if isinstance(v, float):
+        if math.isnan(v) or math.isinf(v):
+            return None
+        return float(f"{v:.7g}")
+    return v
+
+
+def _categorical(values) -> tuple:
+    """Dictionary-encode strings: (categories, int32 codes), -1 for missing."""
+    import numpy as np
+    categories = {}
+    codes = []
+    for v in values:
+        if v is None or (isinstance(v, float) and math.isnan(v)):
+            codes.append(-1)
+        else:
+            codes.append(categories.setdefault(str(v), len(categories)))
+    return list(categories), np.array(codes, dtype=np.int32)
+
+
+def _group_bounds(codes):
+    """(start, stop) of each run of equal codes in an already-grouped array."""
+    import numpy as np
+    if not len(codes):
+        return []
+    cuts = np.flatnonzero(np.diff(codes)) + 1
+    return zip(np.r_[0, cuts].tolist(), np.r_[cuts, len(codes)].tolist())
+
+
+class CompactTests:
+    """HD tests of one type, pruned to the columns the app reads.
+
+    Metrics are float32 arrays and athlete_id / athlete_name are dictionary-encoded.
+    Rows are sorted by athlete then timestamp, so each HawkinID maps to one contiguous
+    row slice and a per-athlete lookup is a dict hit rather than a scan of the column.
+    """
+
+    def __init__(self, type_id: str, records):
+        import numpy as np
+
+        records = list(records)
+        self.type_id = type_id
+        id_cats, id_codes = _categorical(r.get("athlete_id") for r in records)
+        name_cats, name_codes = _categorical(r.get("athlete_name") for r in records)
+        ts = np.array([int(r.get("timestamp") or 0) for r in records], dtype=np.int64)
+
+        order = np.lexsort((ts, id_codes))
+        self._id_cats, self._name_cats = id_cats, name_cats
+        self._ids, self._names, self._ts = id_codes[order], name_codes[order], ts[order]
+        self._metrics = {
+            col: np.array([np.nan if r.get(col) is None else r[col] for r in records], dtype=np.float32)[order]
+            for col in HD_COLUMNS[type_id]
+        }
+
+        self._by_athlete = {
+            id_cats[self._ids[a]]: slice(a, b)
+            for a, b in _group_bounds(self._ids) if self._ids[a] >= 0
+        }
+        # Name fallback rows aren't contiguous; keep their positions in timestamp order
+        by_name = np.lexsort((self._ts, self._names))
+        names = self._names[by_name]
+        self._by_name = {
+            name_cats[names[a]]: by_name[a:b]
+            for a, b in _group_bounds(names) if names[a] >= 0
+        }
+
+    def __len__(self) -> int:
+        return len(self._ts)
+
+    def _rows(self, positions) -> list[dict]:
+        import numpy as np
+        rows = []
+        for i in np.arange(len(self._ts))[positions].tolist():
+            rec = {
+                "athlete_id": self._id_cats[self._ids[i]] if self._ids[i] >= 0 else None,
+                "athlete_name": self._name_cats[self._names[i]] if self._names[i] >= 0 else None,
+                "timestamp": int(self._ts[i]),
+            }
+            for col, values in self._metrics.items():
+                rec[col] = _compact_value(values[i])
+            rec["type"] = self.type_id
+            rows.append(rec)
+        return rows
+
+    def for_athlete(self, hawkin_id) -> list[dict]:
+        """An athlete's tests, oldest first (empty if the HawkinID has none)."""
+        sl = self._by_athlete.get(str(hawkin_id)) if hawkin_id else None
+        return self._rows(sl) if sl is not None else []
+
+    def for_name(self, athlete_name) -> list[dict]:
+        pos = self._by_name.get(athlete_name) if athlete_name else None
+        return self._rows(pos) if pos is not None else []
+
+
+def event_tests(db, type_id: str) -> CompactTests:
+    """Every synced test of one type as a CompactTests table, reloaded when the HD sync adds tests."""
+    def load_watermark():
+        snap = db.collection(HD_WATERMARK_DOC[0]).document(HD_WATERMARK_DOC[1]).get()
+        return (snap.to_dict() or {}) if snap.exists else {}
+
+    state = _watermark.get_or_load("watermark", load_watermark).get(type_id) or {}
+    key = (type_id, state.get("last_sync"), tuple(state.get("window") or ()))
+
+    def load():
+        docs = db.collection(HD_TESTS).where("type", "==", type_id).stream()
+        return CompactTests(type_id, [d.to_dict() for d in docs])
+
+    return _tables.get_or_load(key, load)
+
+
+def athlete_roster(db, refresh: bool = False) -> list[dict] | None:
+    """Every HD athlete as {"id", "name"}, or None if HD isn't configured.
+
+    Served from instance memory, then the shared cache; GetAthletes only runs on a miss.
+    """
+    from func_clients import clients
+
+    if not os.environ.get("HD_TOKEN", "").strip().strip("\"'"):
+        return None
+
+    def load():
+        if not clients.ensure_hd_auth():
+            raise RuntimeError("HD_TOKEN not configured.")
+        from hdforce import GetAthletes
+        df = GetAthletes()
+        if df is None or df.empty or "id" not in df.columns:
+            return []
+        names = df["name"].tolist() if "name" in df.columns else [""] * len(df)
+        return [{"id": str(i), "name": str(n or "")} for i, n in zip(df["id"].tolist(), names)]
+
+    return _roster_cache.get_or_load(db, "athletes", load, refresh=refresh)
+
+
+def sync_tests(db) -> dict:
+    """Pull HD tests synced to HD since the stored watermark into hd_tests.
+
+    The watermark is HD's sync time (GetTests sync mode), not the test timestamp: a
+    force-plate tablet that was offline at the venue uploads its tests late, with
+    timestamps older than tests already pulled. Sync-mode results are then kept only if
+    the test itself falls in the event window. Re-pulls are idempotent (test id doc ids).
+
+    Returns counts per type plus the HawkinIDs that received new tests under "athlete_ids".
+    """
+    from firebase_admin import firestore
+    from hdforce import GetTests
+
+    window_from, window_to = event_window()
+    wm_ref = db.collection(HD_WATERMARK_DOC[0]).document(HD_WATERMARK_DOC[1])
+    wm_snap = wm_ref.get()
+    watermarks = (wm_snap.to_dict() or {}) if wm_snap.exists else {}
+
+    result = {}
+    touched = set()
+    for type_id in HD_TEST_TYPES:
+        state = watermarks.get(type_id) or {}
+        # A changed event window invalidates the old watermark
+        if state.get("window") != [window_from, window_to]:
+            state = {}
+        # A test can't reach HD before it is recorded, so the window start bounds the first pull
+        since = max(window_from, int(state.get("last_sync") or 0))
+
+        df = GetTests(typeId=type_id, from_=since, sync=True)
+        # Prune the wide GetTests frame straight away rather than holding every HD metric
+        records = {
+            test_id: rec for test_id, rec in test_records(df, type_id).items()
+            if rec.get("timestamp") is not None and window_from <= rec["timestamp"] <= window_to
+        }
+
+        batch = db.batch()
+        for i, (test_id, rec) in enumerate(records.items()):
+            batch.set(db.collection(HD_TESTS).document(test_id), rec)
+            if (i + 1) % 400 == 0:
+                batch.commit()
+                batch = db.batch()
+        batch.commit()
+
+        # lastSyncTime of the final page; 0 when nothing new was synced
+        last_sync = int(getattr(df, "attrs", {}).get("Last Sync") or 0)
+        watermarks[type_id] = {"last_sync": max(since, last_sync), "window": [window_from, window_to]}
+        result[type_id] = len(records)
+        touched.update(r["athlete_id"] for r in records.values() if r.get("athlete_id"))
+
+    wm_ref.set({**watermarks, "synced_at": firestore.SERVER_TIMESTAMP})
+    # Scorecards recomputed right after this sync must see the new tests on this instance
+    _watermark.invalidate()
+    result["athlete_ids"] = sorted(touched)
+    return result
+
+
+def athlete_tests(db, type_id: str, hawkin_id=None, athlete_name=None) -> list[dict]:
+    """An athlete's synced tests of one type, oldest first. Falls back to name if no HawkinID rows."""
+    table = event_tests(db, type_id)
+    rows = table.for_athlete(hawkin_id)
+    if not rows and athlete_name:
+        rows = table.for_name(athlete_name)
+    return rows
+
+
+def tests_for_athletes(db, type_id: str, hawkin_ids: list[str]) -> dict:
+    """Synced tests of one type for many HawkinIDs, oldest first. {HawkinID: [rows]}.
+
+    A handful of ids (a trigger rescoring one athlete) are point queries on hd_tests, so a
+    cold trigger instance doesn't stream the whole test type into a table to score them.
+    """
+    if len(hawkin_ids) <= HD_DIRECT_QUERY_MAX:
+        out = {}
+        for hid in hawkin_ids:
+            query = db.collection(HD_TESTS).where("athlete_id", "==", str(hid)).where("type", "==", type_id)
+            rows = [d.to_dict() for d in query.stream()]
+            out[hid] = sorted(rows, key=lambda r: int(r.get("timestamp") or 0))
+        return out
+    table = event_tests(db, type_id)
+    return {hid: table.for_athlete(hid) for hid in hawkin_ids}
+
+
+def _scaled(v, factor):
+    return v * factor if v is not None else None
+
+
+def cmj_display(rows: list[dict]) -> list[dict]:
+    """CMJ rows in the shape the dashboard reads (force_plate_cmj)."""
+    return [{
+        "Jump Height (in)": _scaled(r.get("jump_height_m"), M_TO_IN),
+        "mRSI": r.get("mrsi"),
+        "Peak Rel Prop Power (W/kg)": r.get("peak_relative_propulsive_power_w_kg"),
+        "Braking Asymmetry": float(round(r["lr_braking_impulse_index"])) if r.get("lr_braking_impulse_index") is not None else None,
+    } for r in rows]
+
+
+def mr_display(rows: list[dict]) -> list[dict]:
+    """MR rows in the shape the dashboard reads (force_plate_mr)."""
+    return [{
+        "Number of Jumps": r.get("number_of_jumps_count"),
+        "Avg Jump Height (in)": _scaled(r.get("avg_jump_height_m"), M_TO_IN),
+        "Peak Jump Height (in)": _scaled(r.get("peak_jump_height_m"), M_TO_IN),
+        "Avg RSI": r.get("avg_rsi"),
+        "Peak RSI": r.get("peak_rsi"),
+    } for r in rows]
@@ -0,0 +1,163 @@
+from urllib.parse import quote
+
+from func_cache import TTLCache
+
+# Identity index over athlete_info. One lookup doc per normalized key, holding the
+# athlete_uids that carry it, so email / name / external-ID matching is a point read
+# instead of a stream of the whole roster. Kept current by the athlete_info trigger.
+IDENTITY_INDEX = "athlete_identity"
+BUILT_DOC = ("meta", "identity_index")
+
+# Index kind -> athlete_info field(s) it is built from
+KINDS = {
+    "email": ("Email", "email"),
+    "name": ("Name",),
+    "hawkin": ("HawkinID",),
+    "valor": ("ValorID",),
+    "bookeo": ("bookeo_person_id",),
+}
+
+# Single-flight so concurrent cold requests don't both run the backfill
+_built = TTLCache(maxsize=1)
+
+
+def normalize_key(kind: str, value) -> str | None:
+    """Canonical form of a lookup value, or None if it is blank."""
+    from func_bookeo import normalize_name
+
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    if kind == "email":
+        return value.lower()
+    if kind == "name":
+        return normalize_name(value)
+    return value
+
+
+def doc_id(kind: str, key: str) -> str:
+    # Emails and names may contain "/", which Firestore doc ids cannot
+    return f"{kind}:{quote(key, safe='')}"
+
+
+def identity_keys(d: dict | None) -> set[tuple[str, str]]:
+    """All (kind, key) pairs an athlete_info doc should be findable by."""
+    keys = set()
+    for kind, fields in KINDS.items():
+        for field in fields:
+            key = normalize_key(kind, (d or {}).get(field))
+            if key:
+                keys.add((kind, key))
+                break
+    return keys
+
+
+def apply_change(db, athlete_uid: str, before: dict | None, after: dict | None):
+    """Move an athlete's index entries from the keys of `before` to the keys of `after`."""
+    from firebase_admin import firestore
+
+    old, new = identity_keys(before), identity_keys(after)
+    if old == new:
+        return
+    batch = db.batch()
+    for kind, key in old - new:
+        batch.set(db.collection(IDENTITY_INDEX).document(doc_id(kind, key)),
+                  {"athlete_uids": firestore.ArrayRemove([athlete_uid])}, merge=True)
+    for kind, key in new - old:
+        batch.set(db.collection(IDENTITY_INDEX).document(doc_id(kind, key)),
+                  {"kind": kind, "key": key, "athlete_uids": firestore.ArrayUnion([athlete_uid])}, merge=True)
+    batch.commit()
+
+
+def rebuild_index(db):
+    """Full rebuild from athlete_info. Used to backfill the index on first use."""
+    from firebase_admin import firestore
+
+    entries = {}
+    for doc in db.collection("athlete_info").stream():
+        for kind, key in identity_keys(doc.to_dict()):
+            entries.setdefault((kind, key), []).append(doc.id)
+
+    batch = db.batch()
+    for i, ((kind, key), uids) in enumerate(entries.items()):
+        batch.set(db.collection(IDENTITY_INDEX).document(doc_id(kind, key)),
+                  {"kind": kind, "key": key, "athlete_uids": sorted(uids)})
+        if (i + 1) % 400 == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+    db.collection(BUILT_DOC[0]).document(BUILT_DOC[1]).set({
+        "keys": len(entries),
+        "built_at": firestore.SERVER_TIMESTAMP,
+    })
+
+
+def ensure_index(db):
+    """Backfill the index if it has never been built (checked once per instance)."""
+    def load():
+        if not db.collection(BUILT_DOC[0]).document(BUILT_DOC[1]).get().exists:
+            rebuild_index(db)
+        return True
+    _built.get_or_load("built", load)
+
+
+def lookup_many(db, kind: str, values) -> dict:
+    """Batched point lookups. Returns {normalized key: [athlete_uid, ...]} for keys that match."""
+    ensure_index(db)
+    keys = list(dict.fromkeys(k for k in (normalize_key(kind, v) for v in values) if k))
+    found = {}
+    # Plain slicing rather than func_metrics.chunked, which would pull numpy into light endpoints
+    for i in range(0, len(keys), 300):
+        for snap in db.get_all([db.collection(IDENTITY_INDEX).document(doc_id(kind, k)) for k in keys[i:i + 300]]):
+            if not snap.exists:
+                continue
+            d = snap.to_dict() or {}
+            if d.get("athlete_uids"):
+                found[d["key"]] = d["athlete_uids"]
+    return found
+
+
+def lookup(db, kind: str, value) -> list[str]:
+    """athlete_uids indexed under one value (empty if none)."""
+    key = normalize_key(kind, value)
+    return lookup_many(db, kind, [value]).get(key, []) if key else []
+
+
+def resolve_many(db, kind: str, values) -> dict:
+    """lookup_many confirmed against athlete_info: {normalized key: athlete_uid}.
+
+    The index trails athlete_info by one trigger run, so an entry can still name a doc
+    that was deleted or whose field has since changed. Only a uid whose doc currently
+    carries the key is returned.
+    """
+    candidates = lookup_many(db, kind, values)
+    uids = list(dict.fromkeys(uid for found in candidates.values() for uid in found))
+    current = {}
+    for i in range(0, len(uids), 300):
+        for snap in db.get_all([db.collection("athlete_info").document(uid) for uid in uids[i:i + 300]]):
+            if snap.exists:
+                current[snap.id] = identity_keys(snap.to_dict())
+    resolved = {}
+    for key, found in candidates.items():
+        match = next((uid for uid in found if (kind, key) in current.get(uid, ())), None)
+        if match:
+            resolved[key] = match
+    return resolved
+
+
+def index_new(db, batch, athlete_uid: str, d: dict) -> int:
+    """Queue index entries for a new athlete_info doc on the batch that creates it.
+
+    The trigger adds the same entries later (ArrayUnion, so this is idempotent), but
+    writing them with the create lets an immediate re-run of an import find the doc.
+    Returns the number of writes queued.
+    """
+    from firebase_admin import firestore
+
+    keys = identity_keys(d)
+    for kind, key in keys:
+        batch.set(db.collection(IDENTITY_INDEX).document(doc_id(kind, key)),
+                  {"kind": kind, "key": key, "athlete_uids": firestore.ArrayUnion([athlete_uid])}, merge=True)
+    return len(keys)
@@ -0,0 +1,92 @@
+import base64
+import datetime
+import math
+
+# Callable responses are serialized by firebase_functions itself, so all we need is a
+# payload made only of JSON types. orjson does that in one native pass (NaN/Inf -> null,
+# numpy scalars and arrays, datetimes); without it a single Python walk does the same.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_ORJSON_OPTIONS = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+# Optional compact binary encoding for large payloads
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def _is_numpy(obj) -> bool:
+    return type(obj).__module__.split(".")[0] == "numpy"
+
+
+def _default(obj):
+    """Types neither encoder handles natively."""
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    if _is_numpy(obj) and hasattr(obj, "tolist"):
+        # ndarray -> nested lists, numpy scalar -> Python scalar
+        return obj.tolist()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if type(obj).__name__ in ("NAType", "NaTType"):
+        return None
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _walk(obj):
+    if obj is None or isinstance(obj, (str, bool, int)):
+        return obj
+    if isinstance(obj, float):
+        return None if math.isnan(obj) or math.isinf(obj) else obj
+    if isinstance(obj, dict):
+        return {k if isinstance(k, str) else str(k): _walk(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_walk(v) for v in obj]
+    return _walk(_default(obj))
+
+
+def to_jsonable(obj):
+    """obj reduced to dict/list/str/int/float/bool/None in one pass. Raises TypeError if it can't be."""
+    if orjson is not None:
+        try:
+            return orjson.loads(orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS))
+        except orjson.JSONEncodeError as e:
+            raise TypeError(str(e)) from e
+    return _walk(obj)
+
+
+def columnar(records: list[dict], dictionary_fields=()) -> dict:
+    """Records as {"count", "columns", "data", "dictionaries"}: each field name once with a
+    value array per column. Fields in `dictionary_fields` hold indexes into their
+    dictionary list instead of repeating the values (None stays None)."""
+    columns = list(dict.fromkeys(k for r in records for k in r))
+    data, dictionaries = {}, {}
+    for col in columns:
+        values = [r.get(col) for r in records]
+        if col in dictionary_fields:
+            lookup, entries, indexes = {}, [], []
+            for v in values:
+                if v is None:
+                    indexes.append(None)
+                    continue
+                # Array fields (Sports, Positions) are keyed by their contents
+                key = tuple(v) if isinstance(v, list) else v
+                if key not in lookup:
+                    lookup[key] = len(entries)
+                    entries.append(v)
+                indexes.append(lookup[key])
+            data[col], dictionaries[col] = indexes, entries
+        else:
+            data[col] = values
+    return {"count": len(records), "columns": columns, "data": data, "dictionaries": dictionaries}
+
+
+def pack_base64(obj) -> str | None:
+    """MessagePack of obj (after to_jsonable) as base64 text, or None if msgpack isn't installed."""
+    if msgpack is None:
+        return None
+    return base64.b64encode(msgpack.packb(to_jsonable(obj), use_bin_type=True)).decode("ascii")
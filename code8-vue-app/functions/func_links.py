@@ -0,0 +1,91 @@
+from func_hd import athlete_roster as hd_roster
+from func_valor import athlete_roster as valor_roster
+
+# Background validation of the HawkinID / ValorID foreign keys stored on athlete_info.
+# Results land in athlete_info.sync_status (per athlete) and sync_status/links (summary),
+# so get_roster never has to call HD or Valor to know whether a link still resolves.
+LINK_OK = "ok"
+LINK_BROKEN = "broken"
+LINK_UNLINKED = "unlinked"
+
+
+def fetch_hd_ids(db) -> set[str] | None:
+    """All athlete ids known to Hawkin Dynamics, or None if HD is unavailable."""
+    # A fresh pull, which also re-warms the shared roster cache for request paths
+    roster = hd_roster(db, refresh=True)
+    return None if roster is None else {a["id"] for a in roster if a["id"]}
+
+
+def fetch_valor_ids(db) -> set[str] | None:
+    """All athlete ids known to Valor, or None if Valor is unavailable."""
+    roster = valor_roster(db, refresh=True)
+    return None if roster is None else {a["id"] for a in roster if a["id"]}
+
+
+def link_status(value, known_ids: set[str]) -> str:
+    if not value:
+        return LINK_UNLINKED
+    return LINK_OK if str(value) in known_ids else LINK_BROKEN
+
+
+def validate_links(db) -> dict:
+    """Check every athlete's stored FKs against HD/Valor and record changed statuses."""
+    from firebase_admin import firestore
+
+    hd_ids, valor_ids = None, None
+    try:
+        hd_ids = fetch_hd_ids(db)
+    except Exception as e:
+        print(f"Link validation: HD roster fetch failed: {e}")
+    try:
+        valor_ids = fetch_valor_ids(db)
+    except Exception as e:
+        print(f"Link validation: Valor roster fetch failed: {e}")
+
+    summary = {
+        "hd_available": hd_ids is not None,
+        "valor_available": valor_ids is not None,
+        "hd_broken": [],
+        "valor_broken": [],
+        "updated": 0,
+    }
+    if hd_ids is None and valor_ids is None:
+        return summary
+
+    batch = db.batch()
+    pending = 0
+    for doc in db.collection("athlete_info").stream():
+        d = doc.to_dict()
+        current = d.get("sync_status") or {}
+        updates = {}
+
+        # A system that is down leaves its previous status untouched rather than marking links broken
+        if hd_ids is not None:
+            status = link_status(d.get("HawkinID"), hd_ids)
+            if status == LINK_BROKEN:
+                summary["hd_broken"].append(d.get("Name") or doc.id)
+            if current.get("hd_link") != status:
+                updates["sync_status.hd_link"] = status
+        if valor_ids is not None:
+            status = link_status(d.get("ValorID"), valor_ids)
+            if status == LINK_BROKEN:
+                summary["valor_broken"].append(d.get("Name") or doc.id)
+            if current.get("valor_link") != status:
+                updates["sync_status.valor_link"] = status
+
+        # Only write on change so a routine run doesn't fan out athlete_info triggers
+        if updates:
+            updates["sync_status.links_checked_at"] = firestore.SERVER_TIMESTAMP
+            batch.update(doc.reference, updates)
+            pending += 1
+            summary["updated"] += 1
+            if pending % 400 == 0:
+                batch.commit()
+                batch = db.batch()
+    batch.commit()
+
+    db.collection("sync_status").document("links").set({
+        **summary,
+        "checked_at": firestore.SERVER_TIMESTAMP,
+    })
+    return summary
@@ -0,0 +1,70 @@
+import numpy as np
+
+# Firestore collections holding combine test rows, joined on athlete_uid
+METRIC_COLLECTIONS = ["sprint40", "pro_agility", "standing_vert", "broad_jump"]
+
+# Firestore caps `in` filters at 30 values
+IN_QUERY_LIMIT = 30
+
+# rank key -> combine_percentiles column
+COMBINE_RANK_COLUMNS = {
+    "sprint40": "Sprint40",
+    "proAgility": "ProAgility",
+    "verticalJump": "VerticalJump",
+    "broadJump": "BroadJump",
+}
+
+
+def chunked(values: list, size: int = IN_QUERY_LIMIT):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def fetch_metric_rows(db, athlete_uids: list[str]) -> dict:
+    """Load every metric row for a set of athletes with chunked `in` queries.
+
+    Returns {athlete_uid: {collection: [row, ...]}} with an entry for every requested uid.
+    """
+    rows = {uid: {col: [] for col in METRIC_COLLECTIONS} for uid in athlete_uids}
+    for col in METRIC_COLLECTIONS:
+        for chunk in chunked(athlete_uids):
+            for doc in db.collection(col).where("athlete_uid", "in", chunk).stream():
+                d = doc.to_dict()
+                uid = d.get("athlete_uid")
+                if uid in rows:
+                    rows[uid][col].append(d)
+    return rows
+
+
+def best_combine_values(metrics: dict) -> dict:
+    """Best attempt per combine test for one athlete, keyed like COMBINE_RANK_COLUMNS."""
+    best = {}
+    sprints = [float(s["Total"]) for s in metrics.get("sprint40", []) if s.get("Distance") in [40, "40"] and s.get("Total")]
+    if sprints:
+        best["sprint40"] = min(sprints)
+    agils = [float(a["Total"]) for a in metrics.get("pro_agility", []) if a.get("Distance") in [20, "20"] and a.get("Total")]
+    if agils:
+        best["proAgility"] = min(agils)
+    verts = [float(v["VerticalJump"]) for v in metrics.get("standing_vert", []) if v.get("VerticalJump")]
+    if verts:
+        best["verticalJump"] = max(verts)
+    broads = [float(b["BestBroadJump"]) for b in metrics.get("broad_jump", []) if b.get("BestBroadJump")]
+    if broads:
+        best["broadJump"] = max(broads)
+    return best
+
+
+def combine_ranks_batch(best_by_uid: dict, table) -> dict:
+    """Rank many athletes against a compiled combine PercentileTable, one lookup per metric.
+
+    Returns {athlete_uid: {rank_key: percentile}}.
+    """
+    ranks = {uid: {} for uid in best_by_uid}
+    for key, col in COMBINE_RANK_COLUMNS.items():
+        uids = [uid for uid, best in best_by_uid.items() if key in best]
+        if not uids or col not in table:
+            continue
+        result = np.round(table.rank(col, [best_by_uid[uid][key] for uid in uids]), 1)
+        for uid, r in zip(uids, result):
+            ranks[uid][key] = float(r)
+    return ranks
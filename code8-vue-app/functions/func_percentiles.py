@@ -0,0 +1,112 @@
+import math
+
+import numpy as np
+
+try:
+    from func_cache import TTLCache
+except ImportError:  # imported as functions.func_percentiles by the Streamlit app
+    from functions.func_cache import TTLCache
+
+# Percentile reference tables seeded by seed_percentiles.py. They change only when that
+# script runs, so each instance keeps them in memory and reloads only when the version
+# stamp in meta/percentiles is bumped.
+PERCENTILE_TABLES = ["combine_percentiles", "fp_percentiles", "nfl_fp_percentiles"]
+VERSION_DOC = ("meta", "percentiles")
+
+# Metrics where a smaller value earns a higher percentile (times, asymmetry)
+LOWER_IS_BETTER = {"Sprint40", "ProAgility", "BrakingAsymm"}
+
+# How long an instance trusts its last version check before re-reading the stamp
+VERSION_CHECK_SECONDS = 60
+
+# Keyed by (name, version) so a bumped stamp simply misses; old versions age out of the LRU
+_tables = TTLCache(maxsize=2 * len(PERCENTILE_TABLES))  # -> rows
+_compiled = TTLCache(maxsize=2 * len(PERCENTILE_TABLES))  # -> PercentileTable
+_version = TTLCache(ttl=VERSION_CHECK_SECONDS, maxsize=1)
+
+
+def _is_number(v) -> bool:
+    if isinstance(v, bool) or v is None:
+        return False
+    try:
+        return not math.isnan(float(v))
+    except (TypeError, ValueError):
+        return False
+
+
+class PercentileTable:
+    """A percentile reference table compiled once into sorted NumPy arrays per metric.
+
+    Each metric keeps its values sorted ascending with the matching percentiles carried
+    along, so lookups work the same whether higher or lower is better. All lookups take
+    scalars or arrays and are a single vectorized np.interp / np.searchsorted call.
+    """
+
+    def __init__(self, rows, lower_is_better: set[str] | None = None):
+        if hasattr(rows, "to_dict"):
+            rows = rows.to_dict(orient="records")
+        flags = LOWER_IS_BETTER if lower_is_better is None else lower_is_better
+        columns = {k for r in rows for k in r} - {"Percentile"}
+        self._metrics = {}
+        for col in columns:
+            pairs = [(float(r[col]), float(r["Percentile"])) for r in rows
+                     if _is_number(r.get(col)) and _is_number(r.get("Percentile"))]
+            if not pairs:
+                continue
+            arr = np.array(pairs, dtype=float)
+            order = np.argsort(arr[:, 0], kind="stable")
+            self._metrics[col] = (arr[order, 0], arr[order, 1], col in flags)
+
+    def __contains__(self, metric: str) -> bool:
+        return metric in self._metrics
+
+    def lower_is_better(self, metric: str) -> bool:
+        return self._metrics[metric][2] if metric in self._metrics else False
+
+    def rank(self, metric: str, values, method: str = "interp", missing: float = np.nan):
+        """Percentile for each value.
+
+        method="interp" interpolates linearly between table rows (clamped at the ends).
+        method="step" returns the percentile of the first row whose value is >= the
+        input, or `missing` when the input is beyond the table.
+        """
+        values = np.asarray(values, dtype=float)
+        if metric not in self._metrics:
+            return np.full(values.shape, np.nan)
+        xp, fp, _ = self._metrics[metric]
+        if method == "step":
+            idx = np.searchsorted(xp, values, side="left")
+            return np.where(idx < len(xp), fp[np.minimum(idx, len(xp) - 1)], missing)
+        return np.interp(values, xp, fp)
+
+    def rank_one(self, metric: str, value, method: str = "interp", missing: float = np.nan, ndigits: int = 1):
+        """Rounded percentile for a single value, or None if it can't be ranked."""
+        r = float(self.rank(metric, [value], method=method, missing=missing)[0])
+        return None if math.isnan(r) else round(r, ndigits)
+
+
+def current_version(db):
+    """Version stamp from Firestore, re-read at most every VERSION_CHECK_SECONDS."""
+    def load():
+        snap = db.collection(VERSION_DOC[0]).document(VERSION_DOC[1]).get()
+        return (snap.to_dict() or {}).get("version", 0) if snap.exists else 0
+    return _version.get_or_load("version", load)
+
+
+def get_table(db, name: str) -> list[dict]:
+    """Rows of a percentile table, served from the instance cache while the version holds."""
+    version = current_version(db)
+    return _tables.get_or_load((name, version), lambda: [d.to_dict() for d in db.collection(name).stream()])
+
+
+def get_compiled(db, name: str) -> PercentileTable:
+    """PercentileTable for a reference table, compiled once per version per instance."""
+    version = current_version(db)
+    return _compiled.get_or_load((name, version), lambda: PercentileTable(get_table(db, name)))
+
+
+def invalidate():
+    """Drop every cached table and force the next call to re-check the version."""
+    _tables.invalidate()
+    _compiled.invalidate()
+    _version.invalidate()
@@ -0,0 +1,120 @@
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+from func_cache import TTLCache
+
+# On-demand profiling of callable invocations. A run is profiled when an admin sends
+# `_profile: true` in the request data, or when its endpoint is listed in the config doc
+# (meta/profiling {"endpoints": [...]}, editable in the console, so no redeploy needed).
+# Results go to the profiles collection, or to PROFILE_DIR (a temp dir under the emulator).
+PROFILES = "profiles"
+CONFIG_DOC = ("meta", "profiling")
+
+# Functions kept in the stored summary, by cumulative time
+PROFILE_TOP = 40
+# Raw pstats are stored alongside the summary only below this compressed size (doc limit is 1 MiB)
+PROFILE_RAW_MAX_BYTES = 900_000
+
+# Config doc re-read at most once a minute per instance
+_config = TTLCache(ttl=60, maxsize=1)
+# cProfile can only run one profiler per process at a time; concurrent requests skip it
+_running = threading.Lock()
+
+
+def _profile_dir() -> str | None:
+    path = os.environ.get("PROFILE_DIR", "").strip().strip("\"'")
+    if path:
+        return path
+    if os.environ.get("FUNCTIONS_EMULATOR") == "true":
+        return os.path.join(tempfile.gettempdir(), "slo-combine-profiles")
+    return None
+
+
+def configured(db, endpoint: str) -> bool:
+    """True if the config doc asks for every invocation of `endpoint` to be profiled."""
+    def load():
+        snap = db.collection(CONFIG_DOC[0]).document(CONFIG_DOC[1]).get()
+        return set((snap.to_dict() or {}).get("endpoints") or []) if snap.exists else set()
+    try:
+        return endpoint in _config.get_or_load("endpoints", load)
+    except Exception as e:
+        print(f"Profiling config read failed: {e}")
+        return False
+
+
+def top_functions(stats, limit: int = PROFILE_TOP) -> list[dict]:
+    """Hottest functions by cumulative time from a pstats.Stats."""
+    rows = []
+    for (filename, line, name), (primitive, calls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            "function": f"{os.path.basename(filename)}:{line}({name})",
+            "calls": calls,
+            "primitive_calls": primitive,
+            "tottime_ms": round(tottime * 1000, 3),
+            "cumtime_ms": round(cumtime * 1000, 3),
+        })
+    rows.sort(key=lambda r: r["cumtime_ms"], reverse=True)
+    return rows[:limit]
+
+
+def _save(db, endpoint: str, stats, wall_ms: float, caller: str | None, reason: str) -> str:
+    import marshal
+
+    started = datetime.datetime.now(datetime.timezone.utc)
+    profile_id = f"{endpoint}-{started.strftime('%Y%m%dT%H%M%S%f')}"
+    summary = {
+        "endpoint": endpoint,
+        "reason": reason,
+        "caller_uid": caller,
+        "wall_ms": round(wall_ms, 1),
+        "total_calls": stats.total_calls,
+        "top": top_functions(stats),
+    }
+    directory = _profile_dir()
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        stats.dump_stats(os.path.join(directory, f"{profile_id}.prof"))
+        with open(os.path.join(directory, f"{profile_id}.json"), "w") as f:
+            json.dump({**summary, "created_at": started.isoformat()}, f, indent=2)
+        return profile_id
+
+    from firebase_admin import firestore
+    # zlib'd marshal of pstats data: decompress to a file and open with pstats.Stats(path)
+    raw = zlib.compress(marshal.dumps(stats.stats))
+    doc = {**summary, "created_at": firestore.SERVER_TIMESTAMP, "raw_size": len(raw)}
+    if len(raw) <= PROFILE_RAW_MAX_BYTES:
+        doc["pstats"] = raw
+    db.collection(PROFILES).document(profile_id).set(doc)
+    return profile_id
+
+
+def run(db, endpoint: str, fn, *args, caller: str | None = None, reason: str = "request"):
+    """fn(*args) under cProfile, saving the profile afterwards.
+
+    Only the calling thread is profiled: work fanned out to pools shows up as the time
+    spent waiting on their futures.
+    """
+    import cProfile
+    import pstats
+
+    if not _running.acquire(blocking=False):
+        print(f"Profiling skipped for {endpoint}: another profile is running on this instance")
+        return fn(*args)
+    profiler = cProfile.Profile()
+    t0 = time.perf_counter()
+    try:
+        return profiler.runcall(fn, *args)
+    finally:
+        wall_ms = (time.perf_counter() - t0) * 1000
+        _running.release()
+        try:
+            profile_id = _save(db, endpoint, pstats.Stats(profiler), wall_ms, caller, reason)
+            print(f"Profile {profile_id} saved ({wall_ms:.0f} ms)")
+        except Exception as e:
+            # Profiling is diagnostic; never fail the request over it
+            print(f"Profile save failed for {endpoint}: {e}")
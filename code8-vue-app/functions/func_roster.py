@@ -0,0 +1,260 @@
+import csv
+import datetime
+import io
+import re
+import zlib
+
+# Materialized roster view. get_roster reads these few shard docs instead of
+# streaming athlete_info and every metric collection on each request.
+ROSTER_VIEW = "roster_view"
+ROSTER_SHARDS = 4
+
+# Versioning for get_roster deltas, without a shared counter every trigger would contend
+# on: each entry carries changed_at (its write's commit timestamp), a client's version is
+# the read time of its snapshot, and a delta is every entry changed after it. Deleted
+# athletes stay as profile-less tombstones; those older than this are pruned on a later
+# deletion, raising the shard's horizon (clients older than a horizon get a full roster).
+TOMBSTONE_TTL_DAYS = 7
+
+# Metric collections whose presence flags are tracked per athlete in the view
+METRIC_COLLECTIONS = ["sprint40", "pro_agility", "standing_vert", "broad_jump"]
+
+# Low-cardinality roster fields sent dictionary-encoded in the columnar get_roster format
+DICTIONARY_FIELDS = [
+    "Gender", "GradYear", "SchoolGrade", "CurrentSchool", "LimbDominance", "Sports", "Positions",
+    "HawkinLink", "ValorLink",
+]
+
+PROFILE_FIELDS = [
+    "Name", "Email", "BirthDate", "Gender", "GradYear", "SchoolGrade", "HeightInches",
+    "LimbDominance", "Sports", "Positions", "CurrentSchool", "HawkinID", "ValorID",
+]
+
+
+# Cells read as missing, matching what pandas.read_csv treated as NaN for roster uploads
+CSV_MISSING = {"", "NA", "N/A", "n/a", "NaN", "nan", "null", "NULL", "None", "#N/A"}
+# Plain decimal numbers only: int()/float() also accept "1_000", "1e5", "inf" and the
+# like, which in a roster are IDs or text and must stay strings
+CSV_INT = re.compile(r"[+-]?\d+")
+CSV_FLOAT = re.compile(r"[+-]?(\d+\.\d*|\.\d+)")
+
+
+def _csv_value(raw: str):
+    """Type a CSV cell: missing -> None, then bool, plain int, plain decimal, else text."""
+    value = raw.strip()
+    if value in CSV_MISSING:
+        return None
+    if value in ("True", "TRUE", "true"):
+        return True
+    if value in ("False", "FALSE", "false"):
+        return False
+    if CSV_INT.fullmatch(value):
+        return int(value)
+    if CSV_FLOAT.fullmatch(value):
+        return float(value)
+    return raw
+
+
+def parse_roster_csv(csv_text: str) -> list[dict]:
+    """Roster CSV rows as dicts, without pulling pandas into the upload request path."""
+    reader = csv.DictReader(io.StringIO(csv_text))
+    return [{k: _csv_value(v or "") for k, v in row.items() if k is not None} for row in reader]
+
+
+def shard_for(athlete_uid: str) -> str:
+    """Stable shard doc id for an athlete (crc32 so it is identical across instances)."""
+    return f"shard_{zlib.crc32(athlete_uid.encode('utf-8')) % ROSTER_SHARDS}"
+
+
+def shard_refs(db) -> list:
+    return [db.collection(ROSTER_VIEW).document(f"shard_{i}") for i in range(ROSTER_SHARDS)]
+
+
+def build_profile(d: dict) -> dict:
+    """Reduce a raw athlete_info doc to the fields the roster view serves."""
+    profile = {k: d.get(k) for k in PROFILE_FIELDS}
+    if not profile["Email"]:
+        profile["Email"] = d.get("email")
+    # Link health written by the background validation job (see func_links)
+    sync_status = d.get("sync_status") or {}
+    profile["HawkinLink"] = sync_status.get("hd_link")
+    profile["ValorLink"] = sync_status.get("valor_link")
+    return profile
+
+
+def _micros(ts) -> int:
+    """Firestore timestamp as integer microseconds since the epoch (0 for None)."""
+    if ts is None:
+        return 0
+    return (ts - datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)) // datetime.timedelta(microseconds=1)
+
+
+def upsert_profile(db, athlete_uid: str, d: dict):
+    """Replace an athlete's profile in the view, leaving their metric flags intact.
+
+    The only write that turns a tombstone back into a live entry.
+    """
+    from firebase_admin import firestore
+    ref = db.collection(ROSTER_VIEW).document(shard_for(athlete_uid))
+    ref.set({"athletes": {athlete_uid: {"profile": build_profile(d), "changed_at": firestore.SERVER_TIMESTAMP}}},
+            merge=[f"athletes.{athlete_uid}.profile", f"athletes.{athlete_uid}.changed_at"])
+
+
+def remove_athlete(db, athlete_uid: str):
+    """Leave a tombstone for the athlete and prune tombstones older than TOMBSTONE_TTL_DAYS."""
+    from firebase_admin import firestore
+    ref = db.collection(ROSTER_VIEW).document(shard_for(athlete_uid))
+    snap = ref.get()
+    if not snap.exists:
+        ref.set({"athletes": {athlete_uid: {"changed_at": firestore.SERVER_TIMESTAMP}}}, merge=True)
+        return
+
+    d = snap.to_dict() or {}
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=TOMBSTONE_TTL_DAYS)
+    update = {f"athletes.{athlete_uid}": {"changed_at": firestore.SERVER_TIMESTAMP}}
+    for uid, entry in (d.get("athletes") or {}).items():
+        if uid != athlete_uid and entry.get("profile") is None and _micros(entry.get("changed_at")) < _micros(cutoff):
+            update[f"athletes.{uid}"] = firestore.DELETE_FIELD
+    if len(update) > 1 and _micros(cutoff) > _micros(d.get("horizon")):
+        update["horizon"] = cutoff
+    ref.update(update)
+
+
+def _write_flags(db, athlete_uid: str, flags: dict):
+    """Set metric presence flags, unless the athlete has no profile in the view.
+
+    Metric rows of a deleted athlete (or one not yet registered) would otherwise bring
+    back a profile-less entry and bump its changed_at over the tombstone.
+    """
+    from firebase_admin import firestore
+    ref = db.collection(ROSTER_VIEW).document(shard_for(athlete_uid))
+    snap = ref.get(field_paths=[f"athletes.{athlete_uid}.profile"])
+    entry = ((snap.to_dict() or {}).get("athletes") or {}).get(athlete_uid) if snap.exists else None
+    if not entry or entry.get("profile") is None:
+        return
+    ref.set({"athletes": {athlete_uid: {"metrics": flags, "changed_at": firestore.SERVER_TIMESTAMP}}}, merge=True)
+
+
+def _has_rows(db, collection: str, athlete_uid: str) -> bool:
+    return any(True for _ in db.collection(collection).where("athlete_uid", "==", athlete_uid).limit(1).stream())
+
+
+def refresh_metric_flag(db, collection: str, athlete_uid: str):
+    """Recompute whether an athlete has any rows in a metric collection (one indexed read)."""
+    _write_flags(db, athlete_uid, {collection: _has_rows(db, collection, athlete_uid)})
+
+
+def refresh_metric_flags(db, athlete_uid: str):
+    """All presence flags for a newly added athlete, whose rows may predate their profile."""
+    _write_flags(db, athlete_uid, {col: _has_rows(db, col, athlete_uid) for col in METRIC_COLLECTIONS})
+
+
+def rebuild_view(db) -> dict:
+    """Full rebuild from athlete_info + metric collections. Used to backfill an empty view."""
+    athletes = {}
+    for doc in db.collection("athlete_info").stream():
+        athletes[doc.id] = {"profile": build_profile(doc.to_dict()), "metrics": {}}
+
+    for col in METRIC_COLLECTIONS:
+        for doc in db.collection(col).stream():
+            uid = doc.to_dict().get("athlete_uid")
+            if uid in athletes:
+                athletes[uid]["metrics"][col] = True
+
+    from firebase_admin import firestore
+
+    shards = {f"shard_{i}": {} for i in range(ROSTER_SHARDS)}
+    for uid, entry in athletes.items():
+        entry["changed_at"] = firestore.SERVER_TIMESTAMP
+        shards[shard_for(uid)][uid] = entry
+
+    batch = db.batch()
+    for shard_id, entries in shards.items():
+        # A rebuild can't say what was deleted before it, so older clients refetch in full
+        batch.set(db.collection(ROSTER_VIEW).document(shard_id),
+                  {"athletes": entries, "horizon": firestore.SERVER_TIMESTAMP})
+    batch.commit()
+    return athletes
+
+
+def load_view_versioned(db) -> tuple[dict | None, dict]:
+    """All shards in one batched read, plus {"version", "horizon"} for get_roster deltas.
+
+    version is the earliest read time among the shards: every commit after it has a later
+    changed_at, so a client holding it misses nothing (at worst a change is resent).
+    """
+    athletes = {}
+    found = False
+    read_times, horizon = [], 0
+    for snap in db.get_all(shard_refs(db)):
+        if getattr(snap, "read_time", None) is not None:
+            read_times.append(_micros(snap.read_time))
+        if not snap.exists:
+            continue
+        found = True
+        d = snap.to_dict() or {}
+        athletes.update(d.get("athletes", {}))
+        horizon = max(horizon, _micros(d.get("horizon")))
+    return (athletes if found else None), {"version": min(read_times, default=0), "horizon": horizon}
+
+
+def load_view(db) -> dict | None:
+    """Read all shards. Returns {athlete_uid: entry} or None if the view was never built."""
+    return load_view_versioned(db)[0]
+
+
+def view_delta(view: dict, meta: dict, since_version) -> tuple[str, dict, list[str]]:
+    """What a client holding `since_version` needs: ("unchanged" | "delta" | "full", entries, deleted uids).
+
+    Entries written before versioning existed count as unchanged since the epoch.
+    """
+    if since_version is None or isinstance(since_version, bool):
+        return "full", view, []
+    try:
+        since = int(since_version)
+    except (TypeError, ValueError, OverflowError):
+        # Not a version we handed out; the client just gets everything
+        return "full", view, []
+    if since < meta.get("horizon", 0) or since > meta.get("version", 0):
+        # Older than a rebuild or tombstone prune, or from some other view
+        return "full", view, []
+    changed, deleted = {}, []
+    for uid, entry in view.items():
+        if _micros(entry.get("changed_at")) <= since:
+            continue
+        if entry.get("profile") is None:
+            deleted.append(uid)
+        else:
+            changed[uid] = entry
+    if not changed and not deleted:
+        return "unchanged", {}, []
+    return "delta", changed, sorted(deleted)
+
+
+def roster_record(athlete_uid: str, entry: dict) -> dict | None:
+    """Shape a view entry into the record get_roster has always returned."""
+    profile = entry.get("profile")
+    if profile is None:
+        # Metric rows exist for a uid that has no athlete_info doc
+        return None
+    flags = entry.get("metrics") or {}
+    return {
+        "Name": profile.get("Name") or "",
+        "athlete_uid": athlete_uid,
+        "HawkinID": str(profile["HawkinID"]) if profile.get("HawkinID") else profile.get("HawkinID"),
+        "ValorID": str(profile["ValorID"]) if profile.get("ValorID") else profile.get("ValorID"),
+        "HawkinLink": profile.get("HawkinLink"),
+        "ValorLink": profile.get("ValorLink"),
+        "SprintID": athlete_uid if flags.get("sprint40") else None,
+        "ProAgilID": athlete_uid if flags.get("pro_agility") else None,
+        "Email": profile.get("Email"),
+        "BirthDate": profile.get("BirthDate"),
+        "Gender": profile.get("Gender"),
+        "GradYear": profile.get("GradYear"),
+        "SchoolGrade": profile.get("SchoolGrade"),
+        "HeightInches": profile.get("HeightInches"),
+        "LimbDominance": profile.get("LimbDominance"),
+        "Sports": profile.get("Sports"),
+        "Positions": profile.get("Positions"),
+        "CurrentSchool": profile.get("CurrentSchool"),
+    }
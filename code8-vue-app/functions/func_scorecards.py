@@ -0,0 +1,123 @@
+# numpy and func_metrics load only when cards are built, so the athlete_info and metric
+# triggers can import this module without them
+
+# One pre-ranked document per athlete: best combine values, combine/elite ranks and Valor
+# scores. Recomputed by the metric triggers and after HD/Valor syncs, so dashboards and
+# exports read a single doc instead of ranking raw rows on the request path.
+SCORECARDS = "athlete_scorecards"
+
+# rank key -> (fp_percentiles column, hd_tests field) for the Elite (force plate) ranks
+FP_RANK_COLUMNS = {
+    "fp_jump_height": ("JumpHeight", "jump_height_m"),
+    "fp_mrsi": ("mRSI", "mrsi"),
+}
+
+
+# athlete_info link field -> identity index kind
+LINK_KINDS = {"HawkinID": "hawkin", "ValorID": "valor"}
+
+
+def uids_for_links(db, field: str, ids) -> list[str]:
+    """athlete_info doc ids whose `field` (HawkinID / ValorID) is one of `ids`."""
+    from func_identity import lookup_many
+
+    # The index stores ids as strings, so numeric ids from hand entry / CSV import match too
+    found = lookup_many(db, LINK_KINDS[field], ids)
+    return sorted({uid for uids in found.values() for uid in uids})
+
+
+def build_scorecards(db, athlete_uids: list[str]) -> dict:
+    """Compute scorecards for many athletes in one pass. Returns {athlete_uid: scorecard}."""
+    import numpy as np
+    from func_metrics import chunked, fetch_metric_rows, best_combine_values, combine_ranks_batch
+    from func_percentiles import current_version, get_compiled
+    from func_hd import tests_for_athletes
+    from func_valor import load_scores
+
+    athlete_uids = list(dict.fromkeys(u for u in athlete_uids if u))
+    if not athlete_uids:
+        return {}
+
+    info = {}
+    for chunk in chunked(athlete_uids, 300):
+        for snap in db.get_all([db.collection("athlete_info").document(u) for u in chunk]):
+            info[snap.id] = (snap.to_dict() or {}) if snap.exists else {}
+    reach = {}
+    for chunk in chunked(athlete_uids, 300):
+        for snap in db.get_all([db.collection("standing_reach").document(u) for u in chunk]):
+            if snap.exists:
+                reach[snap.id] = (snap.to_dict() or {}).get("StandingReachInches")
+
+    rows = fetch_metric_rows(db, athlete_uids)
+    best_by_uid = {uid: best_combine_values(rows[uid]) for uid in athlete_uids}
+    ranks = {uid: {} for uid in athlete_uids}
+    for uid, r in combine_ranks_batch(best_by_uid, get_compiled(db, "combine_percentiles")).items():
+        ranks[uid].update(r)
+
+    hawkin_by_uid = {u: str(info[u]["HawkinID"]) for u in athlete_uids if info.get(u, {}).get("HawkinID")}
+    if hawkin_by_uid:
+        cmj_by_hid = tests_for_athletes(db, "CMJ", list(dict.fromkeys(hawkin_by_uid.values())))
+        cmj_first = {u: cmj_by_hid[h][0] for u, h in hawkin_by_uid.items() if cmj_by_hid.get(h)}
+        if cmj_first:
+            fp_table = get_compiled(db, "fp_percentiles")
+            for key, (col, hd_col) in FP_RANK_COLUMNS.items():
+                uids = [u for u in cmj_first if cmj_first[u].get(hd_col) is not None]
+                if col not in fp_table or not uids:
+                    continue
+                for u, r in zip(uids, np.round(fp_table.rank(col, [cmj_first[u][hd_col] for u in uids]), 1)):
+                    ranks[u][key] = float(r)
+
+    valor_by_uid = {u: str(info[u]["ValorID"]) for u in athlete_uids if info.get(u, {}).get("ValorID")}
+    valor_scores = load_scores(db, list(valor_by_uid.values()))
+
+    version = current_version(db)
+    return {uid: {
+        "athlete_uid": uid,
+        "Name": info.get(uid, {}).get("Name"),
+        "HawkinID": hawkin_by_uid.get(uid),
+        "ValorID": valor_by_uid.get(uid),
+        "standing_reach": reach.get(uid),
+        "best": best_by_uid[uid],
+        "ranks": ranks[uid],
+        "valor": valor_scores.get(valor_by_uid.get(uid), {"Shoulder": 0, "Ankle": 0, "Hip": 0}),
+        "percentiles_version": version,
+    } for uid in athlete_uids}
+
+
+def recompute_scorecards(db, athlete_uids: list[str]) -> dict:
+    """Rebuild and store scorecards for these athletes. Returns what was written."""
+    from firebase_admin import firestore
+
+    cards = build_scorecards(db, athlete_uids)
+    batch = db.batch()
+    for i, (uid, card) in enumerate(cards.items()):
+        batch.set(db.collection(SCORECARDS).document(uid), {**card, "updated_at": firestore.SERVER_TIMESTAMP})
+        if (i + 1) % 400 == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+    return cards
+
+
+def delete_scorecard(db, athlete_uid: str):
+    db.collection(SCORECARDS).document(athlete_uid).delete()
+
+
+def load_scorecards(db, athlete_uids: list[str]) -> dict:
+    """Stored scorecards, rebuilding any that are missing or ranked against an old percentile table."""
+    from func_percentiles import current_version
+    from func_metrics import chunked
+
+    athlete_uids = list(dict.fromkeys(u for u in athlete_uids if u))
+    version = current_version(db)
+    cards, stale = {}, []
+    for chunk in chunked(athlete_uids, 300):
+        for snap in db.get_all([db.collection(SCORECARDS).document(u) for u in chunk]):
+            d = (snap.to_dict() or {}) if snap.exists else None
+            if d is None or d.get("percentiles_version") != version:
+                stale.append(snap.id)
+            else:
+                cards[snap.id] = d
+    if stale:
+        cards.update(recompute_scorecards(db, stale))
+    return cards
@@ -0,0 +1,254 @@
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Per-invocation tracing for the callables. safe_execute opens a Trace; while one is
+# active, every Firestore read/write and upstream HTTP call on that request records a
+# span, and the invocation ends with one structured log line of totals (Cloud Logging
+# parses JSON printed to stdout). Set TRACE_REQUESTS=0 to turn it off.
+TRACE_REQUESTS = os.environ.get("TRACE_REQUESTS", "1").strip().strip("\"'").lower() not in ("0", "false", "no")
+
+# Individual spans listed in the summary line (slowest first)
+TRACE_SLOWEST = 5
+
+_current = contextvars.ContextVar("trace", default=None)
+# Set while inside an instrumented call so SDK-internal delegation isn't counted twice
+_inside = contextvars.ContextVar("trace_inside", default=False)
+
+
+class Trace:
+    """Span totals for one invocation. Thread-safe: fan-out workers record into it too."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.totals = {}  # (kind, op) -> {"count", "ms", "docs", "errors", "status"}
+        self.slowest = []  # (ms, kind, op, name)
+
+    def record(self, kind: str, op: str, ms: float, name: str = "", docs: int = 0,
+               status=None, error: bool = False):
+        with self._lock:
+            t = self.totals.setdefault((kind, op), {"count": 0, "ms": 0.0, "docs": 0, "errors": 0, "status": {}})
+            t["count"] += 1
+            t["ms"] += ms
+            t["docs"] += docs
+            t["errors"] += int(error)
+            if status is not None:
+                t["status"][str(status)] = t["status"].get(str(status), 0) + 1
+            self.slowest.append((ms, kind, op, name))
+            self.slowest.sort(reverse=True)
+            del self.slowest[TRACE_SLOWEST:]
+
+    def summary(self, outcome: str) -> dict:
+        with self._lock:
+            spans = {}
+            for (kind, op), t in sorted(self.totals.items()):
+                entry = {"count": t["count"], "ms": round(t["ms"], 1)}
+                if t["docs"]:
+                    entry["docs"] = t["docs"]
+                if t["errors"]:
+                    entry["errors"] = t["errors"]
+                if t["status"]:
+                    entry["status"] = t["status"]
+                spans.setdefault(kind, {})[op] = entry
+            return {
+                "severity": "INFO",
+                "message": f"trace {self.endpoint} {outcome}",
+                "endpoint": self.endpoint,
+                "outcome": outcome,
+                "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+                "spans": spans,
+                "slowest": [{"kind": k, "op": o, "name": n, "ms": round(ms, 1)} for ms, k, o, n in self.slowest],
+            }
+
+
+def current() -> Trace | None:
+    return _current.get()
+
+
+def start(endpoint: str):
+    """Open a trace for this invocation. Returns a token for finish(), or None if tracing is off."""
+    if not TRACE_REQUESTS:
+        return None
+    instrument()
+    return _current.set(Trace(endpoint))
+
+
+def finish(token, outcome: str = "ok"):
+    """Close the trace opened by start() and print its summary line."""
+    if token is None:
+        return
+    trace = _current.get()
+    _current.reset(token)
+    if trace is not None:
+        print(json.dumps(trace.summary(outcome), default=str))
+
+
+def record(kind: str, op: str, ms: float, **kwargs):
+    """Add a span to the active trace, if any (e.g. serialization time from safe_execute)."""
+    trace = _current.get()
+    if trace is not None:
+        trace.record(kind, op, ms, **kwargs)
+
+
+def carry(fn):
+    """fn bound to the caller's context, so pool workers record into the caller's trace."""
+    ctx = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        # A Context can't be entered by two threads at once; each call gets its own copy
+        return ctx.copy().run(fn, *args, **kwargs)
+    return run
+
+
+def _timed(kind: str, op: str, describe, count=None):
+    """Wrap a blocking method so each call is recorded as one span."""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            trace = _current.get()
+            if trace is None or _inside.get():
+                return method(self, *args, **kwargs)
+            token = _inside.set(True)
+            t0 = time.perf_counter()
+            docs, error = (count(self) if count else 1), False
+            try:
+                return method(self, *args, **kwargs)
+            except Exception:
+                error = True
+                raise
+            finally:
+                _inside.reset(token)
+                trace.record(kind, op, (time.perf_counter() - t0) * 1000, name=describe(self, args),
+                             docs=docs, error=error)
+        wrapper._traced = True
+        return wrapper
+    return decorate
+
+
+def _streamed(op: str, describe):
+    """Wrap a generator method: time only the pulls (not the caller's loop body) and count docs."""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            trace = _current.get()
+            if trace is None or _inside.get():
+                return method(self, *args, **kwargs)
+            return _pull(trace, op, describe(self, args), method(self, *args, **kwargs))
+        wrapper._traced = True
+        return wrapper
+    return decorate
+
+
+def _pull(trace: Trace, op: str, name: str, results):
+    it = iter(results)
+    docs, elapsed, error = 0, 0.0, False
+    try:
+        while True:
+            token = _inside.set(True)
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                break
+            except Exception:
+                error = True
+                raise
+            finally:
+                elapsed += time.perf_counter() - t0
+                _inside.reset(token)
+            docs += 1
+            yield item
+    finally:
+        trace.record("firestore", op, elapsed * 1000, name=name, docs=docs, error=error)
+
+
+def _path(obj) -> str:
+    return getattr(obj, "path", None) or getattr(getattr(obj, "_parent", None), "id", None) or ""
+
+
+def _instrument_firestore():
+    try:
+        from google.cloud.firestore_v1.batch import WriteBatch
+        from google.cloud.firestore_v1.client import Client
+        from google.cloud.firestore_v1.document import DocumentReference
+        from google.cloud.firestore_v1.query import Query
+        from google.cloud.firestore_v1.transaction import Transaction
+    except ImportError:
+        return
+
+    def pending_writes(batch) -> int:
+        return len(getattr(batch, "_write_pbs", None) or [])
+
+    patches = [
+        (DocumentReference, "get", _timed("firestore", "get", lambda self, a: _path(self))),
+        (DocumentReference, "delete", _timed("firestore", "write", lambda self, a: _path(self))),
+        # set/update/create on a DocumentReference commit through WriteBatch.commit
+        (WriteBatch, "commit", _timed("firestore", "write", lambda self, a: "batch", count=pending_writes)),
+        (Transaction, "_commit", _timed("firestore", "write", lambda self, a: "transaction", count=pending_writes)),
+        # CollectionReference.stream and Query.get both go through Query.stream
+        (Query, "stream", _streamed("stream", lambda self, a: _path(self))),
+        (Client, "get_all", _streamed("get_all", lambda self, a: "get_all")),
+    ]
+    for cls, attr, decorate in patches:
+        method = getattr(cls, attr, None)
+        if method is not None and not getattr(method, "_traced", False):
+            setattr(cls, attr, decorate(method))
+
+
+def _service(url: str) -> str:
+    """Upstream an HTTP call belongs to, for grouping spans."""
+    host = urlsplit(url).netloc.lower()
+    valor_host = urlsplit(os.environ.get("VALOR_URL", "").strip().strip("\"'")).netloc.lower()
+    if "hawkin" in host:
+        return "hd"
+    if "bookeo" in host:
+        return "bookeo"
+    if "cognito" in host or (valor_host and host == valor_host) or "valor" in host:
+        return "valor"
+    return host or "http"
+
+
+def _instrument_http():
+    # requests is loaded lazily (func_clients, hdforce); patch it once it is in the process
+    if "requests" not in sys.modules:
+        return
+    from requests import Session
+
+    method = Session.request
+    if getattr(method, "_traced", False):
+        return
+
+    @functools.wraps(method)
+    def request(self, verb, url, *args, **kwargs):
+        trace = _current.get()
+        if trace is None:
+            return method(self, verb, url, *args, **kwargs)
+        t0 = time.perf_counter()
+        status = None
+        try:
+            response = method(self, verb, url, *args, **kwargs)
+            status = response.status_code
+            return response
+        except Exception as e:
+            status = type(e).__name__
+            raise
+        finally:
+            trace.record("http", _service(url), (time.perf_counter() - t0) * 1000,
+                         name=f"{verb} {urlsplit(url).path}", status=status,
+                         error=not isinstance(status, int) or status >= 400)
+    request._traced = True
+    Session.request = request
+
+
+def instrument():
+    """Install the Firestore and HTTP hooks (idempotent; cheap once installed)."""
+    _instrument_firestore()
+    _instrument_http()
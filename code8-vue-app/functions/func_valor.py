@@ -0,0 +1,453 @@
+import os
+import json
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from func_cache import SharedCache
+from func_trace import carry
+
+# requests and the client manager load on the first Valor call, so reading precomputed
+# scores (scorecard triggers, get_athlete_metrics) doesn't pull them in
+
+
+def _env_number(name: str, default, cast=int):
+    raw = os.environ.get(name, "").strip().strip("\"'")
+    try:
+        return cast(raw) if raw else default
+    except ValueError:
+        return default
+
+
+# Tunables for Valor report downloads (set in functions/.env)
+VALOR_TIMEOUT = _env_number("VALOR_TIMEOUT", 20.0, float)      # seconds per request
+VALOR_RETRIES = _env_number("VALOR_RETRIES", 2)                # retries on connect errors / 429 / 5xx
+VALOR_REPORT_WORKERS = _env_number("VALOR_REPORT_WORKERS", 6)  # concurrent reportData downloads
+VALOR_REQUESTS_PER_SECOND = _env_number("VALOR_REQUESTS_PER_SECOND", 5.0, float)  # reportData rate cap, 0 = none
+
+# Sessions persisted by sync_sessions, checkpoint in sync_status/valor_sessions
+VALOR_SESSIONS = "valor_sessions"
+VALOR_SESSIONS_CHECKPOINT = ("sync_status", "valor_sessions")
+# Stop a sync run after this long and resume from the saved continuation token next time
+VALOR_SYNC_BUDGET_SECONDS = _env_number("VALOR_SYNC_BUDGET_SECONDS", 240.0, float)
+# Whole sync run (session crawl + report downloads + scoring), under the 540 s function timeout
+VALOR_RUN_BUDGET_SECONDS = _env_number("VALOR_RUN_BUDGET_SECONDS", 450.0, float)
+# Reports downloaded and saved to valor_reports per step, so a run cut short keeps its progress
+VALOR_REPORT_CHUNK = 60
+# Valor athlete roster, shared across instances through the upstream_cache tier
+VALOR_ROSTER_TTL = _env_number("VALOR_ROSTER_TTL", 900.0, float)
+_roster_cache = SharedCache("valor", ttl=VALOR_ROSTER_TTL)
+
+
+def event_date() -> str:
+    """Date prefix (YYYY-MM-DD) of the Valor sessions that count for the event."""
+    return os.environ.get("VALOR_EVENT_DATE", "").strip().strip("\"'") or "2025-07-26"
+
+
+# Parsed reports, one doc per s3Key (a recorded report never changes)
+VALOR_REPORTS = "valor_reports"
+# Event-day Ankle/Shoulder/Hip scores per ValorID, written by precompute_scores
+VALOR_SCORES = "valor_scores"
+
+
+# Session-name groupings that make up each movement score
+VALOR_SCORE_GROUPS = {
+    "Ankle": ["Left Regular Ankle Dorsiflexion - Weighted", "Right Regular Ankle Dorsiflexion - Weighted"],
+    "Shoulder": ["Left 90-90 Test Unilateral Shoulder IR/ER", "Right 90-90 Test Unilateral Shoulder IR/ER"],
+    "Hip": ["Hip Hinge Test"],
+}
+
+
+class _RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across every thread on the instance."""
+
+    def __init__(self, rate: float):
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    def wait(self):
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_for = self._next_at - now
+            self._next_at = max(now, self._next_at) + self._interval
+        if wait_for > 0:
+            time.sleep(wait_for)
+
+
+_report_limiter = _RateLimiter(VALOR_REQUESTS_PER_SECOND)
+
+
+def get_session():
+    """Keep-alive session shared by every Valor call on this instance, with retry/backoff."""
+    from func_clients import clients
+    return clients.session("valor", retries=VALOR_RETRIES, pool_size=max(VALOR_REPORT_WORKERS, 10))
+
+
+def valor_get(url: str, headers: dict, extra_headers: dict | None = None, **kwargs):
+    """GET against Valor that logs in again and retries once on a 401.
+
+    A token revoked or expired early would otherwise be served from the client cache until
+    its computed expiry. The fresh token is written back into `headers`, so later calls
+    sharing that dict (the next sessions page, other report workers) use it directly.
+    """
+    from func_clients import clients
+
+    res = get_session().get(url, headers={**headers, **(extra_headers or {})}, **kwargs)
+    if res.status_code != 401:
+        return res
+    rejected = (headers.get("Authorization") or "").removeprefix("Bearer ")
+    clients.invalidate_valor_token(rejected)
+    token = clients.valor_token()
+    if not token:
+        return res
+    headers["Authorization"] = f"Bearer {token}"
+    return get_session().get(url, headers={**headers, **(extra_headers or {})}, **kwargs)
+
+
+def extract_valor_score(data: dict) -> float:
+    """Helper to extract and average the Score values from a Valor JSON response."""
+    ang_data = data.get("WorkoutMetrics", {}).get("Ang", {})
+    scores = []
+    for metric, side_dict in ang_data.items():
+        for side in side_dict:
+            val = side_dict.get(side, {})
+            if "Score" in val and val["Score"] is not None:
+                scores.append(val["Score"])
+    if scores:
+        return float(sum(scores) / len(scores) * 100)
+    return 0.0
+
+
+def report_rows(data: dict) -> list[dict]:
+    """Joint-level rows (Metric, Side, AvgMax, Score) as utility.ValorExtraction builds them."""
+    ang_data = data.get("WorkoutMetrics", {}).get("Ang", {})
+    rows = []
+    for metric, side_dict in ang_data.items():
+        for side in side_dict:  # Handles 'L', 'R', 'F', 'B'
+            values = side_dict.get(side, {})
+            if values.get("AvgMax") is not None:
+                rows.append({"Metric": metric, "Side": side, "AvgMax": values.get("AvgMax"), "Score": values.get("Score")})
+    return rows
+
+
+def report_summary(s3_key: str, data: dict) -> dict:
+    """What valor_reports keeps per report: the flattened rows and the averaged score."""
+    return {"s3Key": s3_key, "rows": report_rows(data), "score": extract_valor_score(data)}
+
+
+def fetch_report(valor_endpoint: str, headers: dict, s3_key: str) -> dict | None:
+    """Download and parse one reportData body, or None if Valor didn't return it."""
+    _report_limiter.wait()
+    res = valor_get(f"{valor_endpoint}reportData", headers, params={"s3Key": s3_key}, timeout=VALOR_TIMEOUT)
+    if res.status_code != 200:
+        return None
+    body = res.json().get("body", "{}")
+    # The API returns the body as a stringified JSON, so we must parse it
+    if isinstance(body, str):
+        body = json.loads(body)
+    return body
+
+
+def fetch_reports(valor_endpoint: str, headers: dict, s3_keys: list[str]) -> dict:
+    """Download many reports concurrently on a bounded pool. Returns {s3Key: report}."""
+    keys = list(dict.fromkeys(k for k in s3_keys if k))
+    if not keys:
+        return {}
+
+    def fetch(k):
+        try:
+            return k, fetch_report(valor_endpoint, headers, k)
+        except Exception as e:
+            print(f"Valor reportData failed for {k}: {e}")
+            return k, None
+
+    with ThreadPoolExecutor(max_workers=min(VALOR_REPORT_WORKERS, len(keys))) as pool:
+        return {k: report for k, report in pool.map(carry(fetch), keys) if report is not None}
+
+
+def report_summaries(db, s3_keys: list[str], deadline: float | None = None) -> dict:
+    """{s3Key: summary} for each key, from valor_reports, downloading only the ones not cached yet.
+
+    A fully cached request makes no Valor calls at all (not even a token refresh). Downloads
+    go in chunks of VALOR_REPORT_CHUNK, each saved as soon as it lands; past `deadline`
+    (time.monotonic()) no new chunk starts, and the next call picks up where this stopped.
+    """
+    from firebase_admin import firestore
+
+    keys = list(dict.fromkeys(k for k in s3_keys if k))
+    if not keys:
+        return {}
+    from func_metrics import chunked
+
+    summaries = {}
+    for chunk in chunked(keys, 300):
+        refs = [db.collection(VALOR_REPORTS).document(session_doc_id(k)) for k in chunk]
+        for snap in db.get_all(refs):
+            if snap.exists:
+                d = snap.to_dict() or {}
+                if d.get("s3Key"):
+                    summaries[d["s3Key"]] = d
+
+    missing = [k for k in keys if k not in summaries]
+    if not missing:
+        return summaries
+    from func_clients import clients
+    token = clients.valor_token()
+    valor_endpoint = os.environ.get("VALOR_URL", "").strip().strip("\"'")
+    if not token or not valor_endpoint:
+        return summaries
+
+    headers = {"Authorization": f"Bearer {token}"}
+    for i in range(0, len(missing), VALOR_REPORT_CHUNK):
+        if deadline is not None and time.monotonic() >= deadline:
+            print(f"Valor report downloads stopped at the time budget; {len(missing) - i} left for the next run")
+            break
+        reports = fetch_reports(valor_endpoint, headers, missing[i:i + VALOR_REPORT_CHUNK])
+        batch = db.batch()
+        for k, report in reports.items():
+            summary = report_summary(k, report)
+            summaries[k] = summary
+            batch.set(db.collection(VALOR_REPORTS).document(session_doc_id(k)), {**summary, "cached_at": firestore.SERVER_TIMESTAMP})
+        batch.commit()
+    return summaries
+
+
+def score_groups(keys_by_group: dict, summaries: dict) -> dict:
+    """Average the cached report scores over each group (0 when a group has none)."""
+    result = {}
+    for group, keys in keys_by_group.items():
+        scores = [float(summaries[k]["score"]) for k in keys if k in summaries and summaries[k].get("score") is not None]
+        result[group] = round(float(sum(scores) / len(scores)), 1) if scores else 0
+    return result
+
+
+def session_doc_id(s3_key: str) -> str:
+    # s3Keys contain slashes, which Firestore doc ids can't
+    return hashlib.sha1(s3_key.encode("utf-8")).hexdigest()
+
+
+def session_record(item: dict) -> dict | None:
+    """The fields of a Valor session the app uses, or None if it has no report."""
+    s3_key = item.get("s3Key")
+    if not s3_key:
+        return None
+    athlete_id = item.get("Athlete ID")
+    return {
+        "s3Key": s3_key,
+        "athlete_id": str(athlete_id) if athlete_id is not None else None,
+        "session_name": item.get("Session Name"),
+        "date": item.get("Date"),
+    }
+
+
+def athlete_roster(db, refresh: bool = False) -> list[dict] | None:
+    """Every Valor athlete as {"id", "name"}, or None if Valor isn't configured.
+
+    Served from instance memory, then the shared cache; /athletes only runs on a miss.
+    """
+    valor_endpoint = os.environ.get("VALOR_URL", "").strip().strip("\"'")
+    if not valor_endpoint:
+        return None
+
+    def load():
+        from func_clients import clients
+        token = clients.valor_token()
+        if not token:
+            raise RuntimeError("Valor credentials not configured.")
+        res = valor_get(f"{valor_endpoint}athletes", {"Authorization": f"Bearer {token}"}, timeout=30)
+        if res.status_code != 200:
+            raise RuntimeError(f"Valor API returned {res.status_code}")
+        raw = res.json()
+        if isinstance(raw, dict):
+            raw = raw.get("body", "[]")
+        items = json.loads(raw) if isinstance(raw, str) else raw
+        roster = []
+        for a in items:
+            aid = next((a.get(k) for k in ['ValorID', 'Athlete ID', 'AthleteId', 'athleteId', 'id', 'Id'] if a.get(k)), None)
+            name = f"{(a.get('FirstName') or '').strip()} {(a.get('LastName') or '').strip()}".strip()
+            if aid or name:
+                roster.append({"id": str(aid or ""), "name": name})
+        return roster
+
+    return _roster_cache.get_or_load(db, "athletes", load, refresh=refresh)
+
+
+def fetch_sessions_page(valor_endpoint: str, headers: dict, continuation_token: str) -> tuple[list[dict], str | None]:
+    """One page of /sessions. Returns (items, next continuation token or None at the end)."""
+    res = valor_get(f"{valor_endpoint}sessions", headers, extra_headers={'X-Continuation-Token': continuation_token},
+                    timeout=VALOR_TIMEOUT)
+    res.raise_for_status()
+    jdata = res.json()
+    body = jdata.get("body", "[]")
+    items = json.loads(body) if isinstance(body, str) else body
+    next_token = jdata.get("X-Continuation-Token")
+    if not next_token or next_token == "null":
+        next_token = None
+    return items, next_token
+
+
+def sync_sessions(db, valor_endpoint: str, headers: dict) -> dict:
+    """Follow /sessions to the end (or to already-synced data) and persist each session.
+
+    Valor lists sessions newest first, so a crawl from the head can stop at the first page
+    that holds nothing new: no s3Key we haven't stored, or only dates strictly older than
+    the high-water date of the last completed crawl. Dates are day strings, so a page dated
+    on the high-water day itself may still hold unseen same-day sessions.
+    Progress is checkpointed after every page; a run that hits its time budget leaves a
+    resume token and the next run continues from there.
+    """
+    from firebase_admin import firestore
+
+    cp_ref = db.collection(VALOR_SESSIONS_CHECKPOINT[0]).document(VALOR_SESSIONS_CHECKPOINT[1])
+    cp_snap = cp_ref.get()
+    checkpoint = (cp_snap.to_dict() or {}) if cp_snap.exists else {}
+    high_water = checkpoint.get("high_water") or ""
+    resuming = bool(checkpoint.get("resume_token"))
+    token = checkpoint.get("resume_token") or '""'
+    crawl_high = (checkpoint.get("crawl_high") or "") if resuming else ""
+
+    deadline = time.monotonic() + VALOR_SYNC_BUDGET_SECONDS
+    pages, saved = 0, 0
+    complete = False
+    while True:
+        items, next_token = fetch_sessions_page(valor_endpoint, headers, token)
+        pages += 1
+
+        records = [r for r in (session_record(item) for item in items) if r is not None]
+        refs = [db.collection(VALOR_SESSIONS).document(session_doc_id(r["s3Key"])) for r in records]
+        dates = [r["date"] for r in records if r["date"]]
+
+        # high_water is from the last completed crawl, so it still bounds a resumed one
+        caught_up = False
+        if high_water and records:
+            if dates and max(dates) < high_water:
+                caught_up = True
+            else:
+                # Same-day pages can't be judged by date; stop only once a page is all known sessions
+                caught_up = all(snap.exists for snap in db.get_all(refs))
+
+        batch = db.batch()
+        for ref, rec in zip(refs, records):
+            batch.set(ref, rec)
+            saved += 1
+        batch.commit()
+        if dates:
+            crawl_high = max([crawl_high] + dates)
+
+        if next_token is None or caught_up:
+            complete = True
+            break
+        token = next_token
+        if time.monotonic() > deadline:
+            break
+        cp_ref.set({"resume_token": token, "crawl_high": crawl_high}, merge=True)
+
+    if complete:
+        cp_ref.set({
+            "high_water": max(high_water, crawl_high),
+            "resume_token": None,
+            "crawl_high": None,
+            "synced_at": firestore.SERVER_TIMESTAMP,
+        }, merge=True)
+    else:
+        cp_ref.set({"resume_token": token, "crawl_high": crawl_high}, merge=True)
+
+    return {"pages": pages, "sessions": saved, "complete": complete}
+
+
+def group_session_keys(sessions: list[dict]) -> dict:
+    """s3Keys per score group (VALOR_SCORE_GROUPS) for a list of session records."""
+    return {
+        group: [s["s3Key"] for s in sessions if s.get("session_name") in session_names]
+        for group, session_names in VALOR_SCORE_GROUPS.items()
+    }
+
+
+def athlete_session_keys(db, valor_id, date_prefix: str | None = None) -> dict:
+    """s3Keys per score group for one athlete's synced sessions on the event date."""
+    date_prefix = date_prefix or event_date()
+    docs = db.collection(VALOR_SESSIONS).where("athlete_id", "==", str(valor_id)).stream()
+    sessions = [d.to_dict() for d in docs]
+    return group_session_keys([s for s in sessions if str(s.get("date") or "").startswith(date_prefix)])
+
+
+def event_sessions(db, date_prefix: str | None = None) -> list[dict]:
+    """Every synced session on the event date (dates are ISO strings, so a prefix range query)."""
+    date_prefix = date_prefix or event_date()
+    query = db.collection(VALOR_SESSIONS).where("date", ">=", date_prefix).where("date", "<", date_prefix + "\uf8ff")
+    return [d.to_dict() for d in query.stream()]
+
+
+def precompute_scores(db, date_prefix: str | None = None, deadline: float | None = None) -> dict:
+    """Score every athlete with event-day sessions into valor_scores/{ValorID}.
+
+    Reports go through report_summaries, so each one is downloaded from Valor at most once
+    ever, on the rate-limited report pool. If `deadline` cuts the downloads short, nothing
+    is scored (partial reports would publish low scores) and "complete" is False; the
+    saved reports make the next run quicker.
+    """
+    from firebase_admin import firestore
+
+    date_prefix = date_prefix or event_date()
+    by_athlete = {}
+    for s in event_sessions(db, date_prefix):
+        if s.get("athlete_id") and s.get("s3Key"):
+            by_athlete.setdefault(s["athlete_id"], []).append(s)
+
+    keys_by_athlete = {vid: group_session_keys(sessions) for vid, sessions in by_athlete.items()}
+    all_keys = [k for groups in keys_by_athlete.values() for keys in groups.values() for k in keys]
+    summaries = report_summaries(db, all_keys, deadline=deadline)
+    if deadline is not None and time.monotonic() >= deadline and set(all_keys) - set(summaries):
+        return {
+            "athletes": len(keys_by_athlete),
+            "reports": len(summaries),
+            "missing_reports": len(set(all_keys) - set(summaries)),
+            "changed": [],
+            "complete": False,
+        }
+
+    # Only rewrite athletes whose scores moved, so downstream scorecards recompute only for them
+    previous = load_scores(db, list(keys_by_athlete))
+    changed = []
+    batch = db.batch()
+    for vid, keys_by_group in keys_by_athlete.items():
+        scores = score_groups(keys_by_group, summaries)
+        if previous.get(vid) == scores:
+            continue
+        batch.set(db.collection(VALOR_SCORES).document(vid), {
+            **scores,
+            "ValorID": vid,
+            "event_date": date_prefix,
+            "reports": sum(1 for keys in keys_by_group.values() for k in keys if k in summaries),
+            "computed_at": firestore.SERVER_TIMESTAMP,
+        })
+        changed.append(vid)
+        if len(changed) % 400 == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+    return {
+        "athletes": len(keys_by_athlete),
+        "reports": len(summaries),
+        "missing_reports": len(set(all_keys) - set(summaries)),
+        "changed": changed,
+        "complete": True,
+    }
+
+
+def load_scores(db, valor_ids: list[str]) -> dict:
+    """Precomputed {ValorID: {"Shoulder", "Ankle", "Hip"}} for the ids that have a valor_scores doc."""
+    from func_metrics import chunked
+
+    ids = list(dict.fromkeys(str(v) for v in valor_ids if v))
+    out = {}
+    for chunk in chunked(ids, 300):
+        for snap in db.get_all([db.collection(VALOR_SCORES).document(v) for v in chunk]):
+            if snap.exists:
+                d = snap.to_dict() or {}
+                out[snap.id] = {group: d.get(group, 0) for group in ("Shoulder", "Ankle", "Hip")}
+    return out
@@ -1,34 +1,23 @@
-from firebase_functions import https_fn, options
+from firebase_functions import https_fn, firestore_fn, scheduler_fn, options
 from firebase_admin import initialize_app, firestore
 import firebase_admin
 from firebase_admin import auth as firebase_auth
-import pandas as pd
-import json
-import requests
-import numpy as np
 import os
 from dotenv import load_dotenv
-import math
 import datetime
 import traceback
 import functools
-import io
+import time
+from func_json import to_jsonable
+import func_trace
+import func_profile
 
-# We need to import Hawkin Dynamics package
-try:
-    from hdforce import AuthManager, GetAthletes, GetTests
-except ImportError:
-    print("hdforce not installed yet")
+# Every function in this codebase loads this module, so it imports only firebase and the
+# stdlib. pandas/numpy, requests, hdforce and the func_* modules are imported inside the
+# functions that use them; cold_start_budget.py checks this stays true.
 
-# Cache for HD tests to make rapid clicking in the UI instantaneous
-hd_cache = {
-    "CMJ": None,
-    "MR": None
-}
-
-valor_cache = {
-    "sessions": None
-}
+# Upper bound on concurrent upstream fetches issued by a single get_athlete_metrics call
+METRICS_FANOUT_WORKERS = 8
 
 # Safely load the .env variables and strip any quotes
 env_path = os.path.join(os.path.dirname(__file__), ".env")
@@ -51,83 +40,63 @@ if not firebase_admin._apps:
 db = firestore.client()
 
 def get_jwt_token():
-    username = os.environ.get("VALOR_USER", "").strip().strip("\"'")
-    password = os.environ.get("VALOR_PASSWORD", "").strip().strip("\"'")
-    client_id = os.environ.get("VALOR_CLIENT_ID", "").strip().strip("\"'")
-    token_url = os.environ.get("VALOR_TOKEN_URL", "").strip().strip("\"'")
-
-    payload = {
-        "AuthFlow": "USER_PASSWORD_AUTH",
-        "ClientId": client_id,
-        "AuthParameters": {
-            "USERNAME": username,
-            "PASSWORD": password
-        }
-    }
-    headers = {
-        "Content-Type": "application/x-amz-json-1.1",
-        "User-Agent": "insomnia/11.3.0",
-        "X-Amz-Target": "AWSCognitoIdentityProviderService.InitiateAuth"
-    }
+    """Valor IdToken from the per-instance client manager (cached until shortly before expiry)."""
+    # Upstream credentials and pooled HTTP sessions, reused across requests on this instance
+    from func_clients import clients
+    return clients.valor_token()
 
-    response = requests.post(token_url, json=payload, headers=headers)
-    if response.status_code == 200:
-        data = response.json().get("AuthenticationResult", {})
-        return data.get("IdToken")
-    else:
-        print(f"Valor Auth failed: {response.text}")
-        return None
+def _profile_reason(req, endpoint: str) -> str | None:
+    """Why this invocation should run under the profiler, or None.
+
+    `_profile: true` in the request data is honoured for admins only; otherwise the
+    endpoint may be switched on in meta/profiling (see func_profile).
+    """
+    data = req.data if isinstance(req.data, dict) else {}
+    if data.get("_profile"):
+        if req.auth and req.auth.uid:
+            caller = firebase_auth.get_user(req.auth.uid)
+            if (caller.custom_claims or {}).get("role") == "admin":
+                return "request"
+        print(f"Ignoring _profile on {endpoint} from a non-admin caller")
+    return "config" if func_profile.configured(db, endpoint) else None
 
-def extract_valor_score(data: dict) -> float:
-    """Helper to extract and average the Score values from a Valor JSON response."""
-    ang_data = data.get("WorkoutMetrics", {}).get("Ang", {})
-    scores = []
-    for metric, side_dict in ang_data.items():
-        for side in side_dict:
-            val = side_dict.get(side, {})
-            if "Score" in val and val["Score"] is not None:
-                scores.append(val["Score"])
-    if scores:
-        return float(np.mean(scores) * 100)
-    return 0.0
-
-def clean_payload(obj):
-    """Recursively scrub data to ensure it is 100% JSON-serializable for the Vue frontend."""
-    if isinstance(obj, dict):
-        return {k: clean_payload(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [clean_payload(v) for v in obj]
-    elif isinstance(obj, float):
-        return None if math.isnan(obj) or math.isinf(obj) else obj
-    elif isinstance(obj, (datetime.datetime, datetime.date)):
-        return obj.isoformat()
-    elif type(obj).__module__ == 'numpy':
-        if hasattr(obj, 'item'):
-            val = obj.item()
-            return None if isinstance(val, float) and (math.isnan(val) or math.isinf(val)) else val
-        return obj
-    try:
-        if pd.isna(obj):
-            return None
-    except Exception:
-        pass
-    return obj
 
 def safe_execute(func):
-    """Decorator to catch and pipe all Python errors directly to the frontend."""
+    """Decorator to catch and pipe all Python errors directly to the frontend.
+
+    Also traces the invocation: Firestore and upstream HTTP spans plus serialization
+    time, logged as one structured summary line per call (see func_trace), and runs it
+    under the profiler when an admin or the profiling config asks (see func_profile).
+    """
     @functools.wraps(func)
     def wrapper(req: https_fn.CallableRequest) -> any:
+        token = func_trace.start(func.__name__)
+        outcome = "error"
         try:
-            result = func(req)
+            reason = _profile_reason(req, func.__name__)
+            if reason:
+                result = func_profile.run(db, func.__name__, func, req,
+                                          caller=req.auth.uid if req.auth else None, reason=reason)
+            else:
+                result = func(req)
+            t0 = time.perf_counter()
             try:
-                json.dumps(result) # Test serialization because Firebase swallows JSON errors
-            except Exception:
+                # One pass to plain JSON types (NaN/Inf -> None, numpy, datetimes); Firebase
+                # swallows JSON errors, so anything unserializable is reported here instead
+                response = to_jsonable(result)
+            except TypeError:
                 err_str = traceback.format_exc()
                 return {"status": "error", "message": "JSON Serialization Error in Backend", "traceback": err_str}
-            return result
+            finally:
+                func_trace.record("serialize", "to_jsonable", (time.perf_counter() - t0) * 1000)
+            if not (isinstance(response, dict) and response.get("status") == "error"):
+                outcome = "ok"
+            return response
         except Exception as e:
             err_str = traceback.format_exc()
             return {"status": "error", "message": str(e), "traceback": err_str}
+        finally:
+            func_trace.finish(token, outcome)
     return wrapper
 
 @https_fn.on_call(memory=options.MemoryOption.GB_1, timeout_sec=120, cors=options.CorsOptions(cors_origins="*", cors_methods=["get", "post"]))
@@ -136,107 +105,62 @@ def get_roster(req: https_fn.CallableRequest) -> any:
     """
     Builds the roster from athlete_info (Firestore) as the single source of truth.
     Joins external systems (HD, Valor) by stored foreign keys, NOT by name.
+    Reads the materialized roster_view shards rather than the raw collections, and
+    never calls HD or Valor (link status comes from validate_external_links).
+    Optional `format`: "records" (default), "columnar", or "msgpack" (base64 MessagePack
+    of the columnar body; falls back to "columnar" if msgpack isn't installed).
+    Optional `since_version`: the `version` of a previous response. The reply's `mode` is
+    then "unchanged" (no data), "delta" (changed records plus `deleted` athlete_uids) or
+    "full" if that version is too old to diff against.
     """
 
-    # 1. Load athlete_info — this IS the roster
-    athlete_info_docs = list(db.collection("athlete_info").stream())
-    athletes = []
-    for doc in athlete_info_docs:
-        d = doc.to_dict()
-        d["athlete_uid"] = doc.id
-        athletes.append(d)
-
-    if not athletes:
-        return {"status": "success", "data": []}
-
-    # Build lookup sets from stored foreign keys
-    hd_ids = {str(a["HawkinID"]) for a in athletes if a.get("HawkinID")}
-    valor_ids = {str(a["ValorID"]) for a in athletes if a.get("ValorID")}
+    from func_roster import load_view_versioned, rebuild_view, roster_record, view_delta, DICTIONARY_FIELDS
+    from func_json import columnar, pack_base64
+
+    data = req.data or {}
+    fmt = data.get("format") or "records"
+
+    # 1. Load the materialized roster view (a few shard docs kept current by triggers)
+    view, meta = load_view_versioned(db)
+    if view is None:
+        # First call after deploy: backfill the view from athlete_info + metric collections
+        rebuild_view(db)
+        view, meta = load_view_versioned(db)
+
+    version = meta.get("version") or 0
+    mode, view, deleted = view_delta(view, meta, data.get("since_version"))
+    if mode == "unchanged":
+        return {"status": "success", "mode": mode, "version": version}
+    extra = {"mode": mode, "version": version}
+    if mode == "delta":
+        extra["deleted"] = deleted
+
+    # 2. Build the final roster — all data comes from athlete_info. FK validity against HD/Valor
+    # is checked by the background link-validation job and served from sync_status.
+    roster_list = []
+    for uid, entry in view.items():
+        record = roster_record(uid, entry)
+        if record is not None:
+            roster_list.append(record)
 
-    # 2. Fetch HD athletes (for name display / validation of links)
-    hd_by_id = {}
-    try:
-        hd_token = os.environ.get("HD_TOKEN", "").strip().strip("\"'")
-        if hd_token:
-            AuthManager(authMethod="manual", refreshToken=hd_token)
-            hd_df = GetAthletes()
-            if not hd_df.empty and "id" in hd_df.columns:
-                for _, row in hd_df.iterrows():
-                    hd_by_id[str(row["id"])] = row.get("name", "")
-    except Exception as e:
-        print(f"Error fetching HD roster: {e}")
+    roster_list.sort(key=lambda r: r["Name"])
 
-    # 3. Fetch Valor athletes (for name display / validation of links)
-    valor_by_id = {}
-    try:
-        token = get_jwt_token()
-        if token:
-            valor_endpoint = os.environ.get("VALOR_URL", "").strip().strip("\"'")
-            response = requests.get(f"{valor_endpoint}athletes", headers={"Authorization": f"Bearer {token}"})
-            if response.status_code == 200:
-                raw = response.json().get("body", "[]")
-                parsed = json.loads(raw) if isinstance(raw, str) else raw
-                for a in parsed:
-                    fn = (a.get("FirstName") or "").strip()
-                    ln = (a.get("LastName") or "").strip()
-                    id_col = next((a.get(k) for k in ['ValorID', 'Athlete ID', 'AthleteId', 'athleteId', 'id', 'Id'] if a.get(k)), None)
-                    if id_col:
-                        valor_by_id[str(id_col)] = f"{fn} {ln}".strip()
-    except Exception as e:
-        print(f"Error fetching Valor roster: {e}")
-
-    # 4. Check which athletes have Firestore metric data (by athlete_uid)
-    sprint_uids = set()
-    proagil_uids = set()
-    try:
-        for doc in db.collection("sprint40").stream():
-            uid = doc.to_dict().get("athlete_uid")
-            if uid:
-                sprint_uids.add(uid)
-        for doc in db.collection("pro_agility").stream():
-            uid = doc.to_dict().get("athlete_uid")
-            if uid:
-                proagil_uids.add(uid)
-    except Exception as e:
-        print(f"Error checking Firestore metric collections: {e}")
-
-    # 5. Build the final roster — all data comes from athlete_info, validated by FK
-    roster_list = []
-    for a in athletes:
-        uid = a.get("athlete_uid")
-        hid = str(a["HawkinID"]) if a.get("HawkinID") else None
-        vid = str(a["ValorID"]) if a.get("ValorID") else None
-
-        roster_list.append({
-            "Name": a.get("Name", ""),
-            "athlete_uid": uid,
-            "HawkinID": hid if hid and hid in hd_by_id else a.get("HawkinID"),
-            "ValorID": vid if vid and vid in valor_by_id else a.get("ValorID"),
-            "SprintID": uid if uid in sprint_uids else None,
-            "ProAgilID": uid if uid in proagil_uids else None,
-            "Email": a.get("Email") or a.get("email"),
-            "BirthDate": a.get("BirthDate"),
-            "Gender": a.get("Gender"),
-            "GradYear": a.get("GradYear"),
-            "SchoolGrade": a.get("SchoolGrade"),
-            "HeightInches": a.get("HeightInches"),
-            "LimbDominance": a.get("LimbDominance"),
-            "Sports": a.get("Sports"),
-            "Positions": a.get("Positions"),
-            "CurrentSchool": a.get("CurrentSchool"),
-        })
-
-    roster_df = pd.DataFrame(roster_list)
-    if not roster_df.empty and "Name" in roster_df.columns:
-        roster_df = roster_df.sort_values(by="Name")
+    if fmt in ("columnar", "msgpack"):
+        # Field names once and repeated values dictionary-encoded; a fraction of the bytes
+        body = columnar(roster_list, DICTIONARY_FIELDS)
+        packed = pack_base64(body) if fmt == "msgpack" else None
+        if packed is not None:
+            return {"status": "success", "format": "msgpack", "encoding": "base64", "data": packed, **extra}
+        return {"status": "success", "format": "columnar", **body, **extra}
 
     raw_data = {
         "status": "success",
-        "data": roster_df.to_dict(orient="records")
+        "data": roster_list,
+        **extra
     }
-    return clean_payload(raw_data)
+    return raw_data
 
-@https_fn.on_call(memory=options.MemoryOption.GB_1, timeout_sec=120, cors=options.CorsOptions(cors_origins="*", cors_methods=["get", "post"]))
+@https_fn.on_call(memory=options.MemoryOption.MB_512, timeout_sec=120, cors=options.CorsOptions(cors_origins="*", cors_methods=["get", "post"]))
 @safe_execute
 def get_athlete_metrics(req: https_fn.CallableRequest) -> any:
     """
@@ -251,163 +175,216 @@ def get_athlete_metrics(req: https_fn.CallableRequest) -> any:
     if not athlete_uid:
         return {"status": "error", "message": "No athlete_uid provided"}
         
-    collections = ["sprint40", "pro_agility", "standing_vert", "broad_jump"]
+    from func_metrics import METRIC_COLLECTIONS, best_combine_values, combine_ranks_batch
+    from func_percentiles import get_compiled as get_percentile_table
+    from func_hd import HD_TEST_TYPES, athlete_tests, cmj_display, mr_display
+    from func_valor import athlete_session_keys, load_scores, report_summaries, score_groups
+    from concurrent.futures import ThreadPoolExecutor
+
     metrics = {}
     ranks = {}
-    
-    for col in collections:
+
+    def fetch_rows(col):
         docs = db.collection(col).where("athlete_uid", "==", athlete_uid).stream()
         # Convert firestore docs to dicts
-        metrics[col] = [doc.to_dict() for doc in docs]
+        return [doc.to_dict() for doc in docs]
+
+    def fetch_table(name):
+        return get_percentile_table(db, name)
+
+    def fetch_hd_tests(type_id):
+        # Per-athlete rows from the synced hd_tests collection (see sync_hd_tests)
+        return athlete_tests(db, type_id, hawkin_id=athlete_hawkin_id, athlete_name=athlete_name)
+
+    def fetch_valor_scores():
+        valor = {"Shoulder": 0, "Ankle": 0, "Hip": 0}
+        # Event scores precomputed by the Valor sync job are a single document read
+        precomputed = load_scores(db, [athlete_valor_id]).get(str(athlete_valor_id))
+        if precomputed is not None:
+            valor.update(precomputed)
+            return valor
+
+        # Not scored yet: sessions come from the valor_sessions collection kept current by sync_valor_sessions
+        keys_by_group = athlete_session_keys(db, athlete_valor_id)
+
+        # Parsed reports are cached in valor_reports by s3Key; only unseen ones are downloaded
+        summaries = report_summaries(db, [k for keys in keys_by_group.values() for k in keys])
+        valor.update(score_groups(keys_by_group, summaries))
+        return valor
+
+    # Every upstream (Firestore, HD, Valor) is independent, so issue them all at once and
+    # merge below. Latency becomes that of the slowest dependency rather than the sum.
+    want_hd = bool(athlete_hawkin_id or athlete_name)
+
+    # Workers run in the request's trace context so their spans land in its summary
+    fetch_rows, fetch_table, fetch_hd_tests, fetch_valor_scores = map(
+        func_trace.carry, (fetch_rows, fetch_table, fetch_hd_tests, fetch_valor_scores))
+
+    with ThreadPoolExecutor(max_workers=METRICS_FANOUT_WORKERS) as pool:
+        row_futures = {col: pool.submit(fetch_rows, col) for col in METRIC_COLLECTIONS}
+        combine_future = pool.submit(fetch_table, "combine_percentiles")
+        valor_future = pool.submit(fetch_valor_scores) if athlete_valor_id else None
+        hd_futures = {}
+        fp_future = None
+        if want_hd:
+            hd_futures = {t: pool.submit(fetch_hd_tests, t) for t in HD_TEST_TYPES}
+            fp_future = pool.submit(fetch_table, "fp_percentiles")
+
+        for col, fut in row_futures.items():
+            metrics[col] = fut.result()
+
+        # --- Calculate Combine Percentiles ---
+        try:
+            combine_table = combine_future.result()
+            ranks.update(combine_ranks_batch({athlete_uid: best_combine_values(metrics)}, combine_table)[athlete_uid])
+        except Exception as e:
+            print(f"Error calculating combine ranks: {e}")
+
+        # HD Data — join by HawkinID (foreign key), fallback to name
+        try:
+            if "CMJ" in hd_futures:
+                cmj_rows = hd_futures["CMJ"].result()
+                if cmj_rows:
+                    # Calculate FP Percentiles (Elite Rank)
+                    fp_table = fp_future.result()
+                    for key, col, hd_col in (("fp_jump_height", "JumpHeight", "jump_height_m"), ("fp_mrsi", "mRSI", "mrsi")):
+                        if col in fp_table and cmj_rows[0].get(hd_col) is not None:
+                            ranks[key] = fp_table.rank_one(col, cmj_rows[0][hd_col])
+
+                    metrics["force_plate_cmj"] = cmj_display(cmj_rows)
+        except Exception as e:
+            print(f"Error fetching HD metrics: {e}")
+
+        try:
+            if "MR" in hd_futures:
+                mr_rows = hd_futures["MR"].result()
+                if mr_rows:
+                    metrics["force_plate_mr"] = mr_display(mr_rows)
+        except Exception as e:
+            print(f"Error fetching HD metrics: {e}")
+
+        # Valor Movement Data
+        metrics["valor"] = {"Shoulder": 0, "Ankle": 0, "Hip": 0}
+        try:
+            if valor_future is not None:
+                metrics["valor"] = valor_future.result()
+        except Exception as e:
+            print(f"Error fetching Valor metrics: {e}")
+
+    metrics["ranks"] = ranks
+
+    raw_data = {
+        "status": "success",
+        "data": metrics
+    }
+    return raw_data
+
+@https_fn.on_call(memory=options.MemoryOption.MB_512, timeout_sec=120, cors=options.CorsOptions(cors_origins="*", cors_methods=["get", "post"]))
+@safe_execute
+def get_athlete_metrics_batch(req: https_fn.CallableRequest) -> any:
+    """
+    Fetches Firestore metrics, combine ranks and force plate data for many athletes at once.
+    Uses chunked `in` queries per collection and ranks the whole set in one vectorized pass.
+    Valor movement scores come from the precomputed valor_scores docs (zeros until scored).
+    """
+    from func_metrics import fetch_metric_rows, best_combine_values, combine_ranks_batch
+    from func_percentiles import get_compiled as get_percentile_table
+    from func_hd import tests_for_athletes, cmj_display, mr_display
+    from func_valor import load_scores
+    import numpy as np
+
+    athlete_uids = [u for u in dict.fromkeys(req.data.get("athlete_uids") or []) if u]
+    if not athlete_uids:
+        return {"status": "error", "message": "No athlete_uids provided"}
+
+    results = fetch_metric_rows(db, athlete_uids)
+    ranks = {uid: {} for uid in athlete_uids}
 
     # --- Calculate Combine Percentiles ---
     try:
-        combine_pct = [d.to_dict() for d in db.collection("combine_percentiles").stream()]
-        if combine_pct:
-            pct_df = pd.DataFrame(combine_pct).sort_values("Percentile")
-            
-            # Sprint 40 (Lower time is better, so array is reversed for numpy interp)
-            sprints = [float(s["Total"]) for s in metrics.get("sprint40", []) if s.get("Distance") in [40, "40"] and s.get("Total")]
-            if sprints:
-                ranks["sprint40"] = round(float(np.interp(min(sprints), pct_df["Sprint40"].values[::-1], pct_df["Percentile"].values[::-1])), 1)
-                
-            # Pro Agility
-            agils = [float(a["Total"]) for a in metrics.get("pro_agility", []) if a.get("Distance") in [20, "20"] and a.get("Total")]
-            if agils:
-                ranks["proAgility"] = round(float(np.interp(min(agils), pct_df["ProAgility"].values[::-1], pct_df["Percentile"].values[::-1])), 1)
-
-            # Vertical
-            verts = [float(v["VerticalJump"]) for v in metrics.get("standing_vert", []) if v.get("VerticalJump")]
-            if verts:
-                ranks["verticalJump"] = round(float(np.interp(max(verts), pct_df["VerticalJump"].values, pct_df["Percentile"].values)), 1)
-
-            # Broad
-            broads = [float(b["BestBroadJump"]) for b in metrics.get("broad_jump", []) if b.get("BestBroadJump")]
-            if broads:
-                ranks["broadJump"] = round(float(np.interp(max(broads), pct_df["BroadJump"].values, pct_df["Percentile"].values)), 1)
+        combine_table = get_percentile_table(db, "combine_percentiles")
+        best_by_uid = {uid: best_combine_values(results[uid]) for uid in athlete_uids}
+        for uid, r in combine_ranks_batch(best_by_uid, combine_table).items():
+            ranks[uid].update(r)
     except Exception as e:
         print(f"Error calculating combine ranks: {e}")
-        
-    # Fetch HD Data — join by HawkinID (foreign key), fallback to name
+
+    # HawkinID / ValorID foreign keys read from athlete_info in one round trip
+    hawkin_by_uid, valor_by_uid = {}, {}
     try:
-        hd_token = os.environ.get("HD_TOKEN", "").strip().strip("\"'")
-        if hd_token and (athlete_hawkin_id or athlete_name):
-            AuthManager(authMethod="manual", refreshToken=hd_token)
-
-            global hd_cache
-
-            if hd_cache["CMJ"] is None:
-                hd_cache["CMJ"] = GetTests(typeId="CMJ", from_="2025-07-23", to_="2025-07-27")
-
-            cmj_data = hd_cache["CMJ"]
-            if not cmj_data.empty:
-                cmj_athlete = pd.DataFrame()
-                if athlete_hawkin_id and "athlete_id" in cmj_data.columns:
-                    cmj_athlete = cmj_data[cmj_data["athlete_id"].astype(str) == str(athlete_hawkin_id)]
-                if cmj_athlete.empty and athlete_name and "athlete_name" in cmj_data.columns:
-                    cmj_athlete = cmj_data[cmj_data["athlete_name"] == athlete_name]
-                if not cmj_athlete.empty:
-                    # Calculate FP Percentiles (Elite Rank)
-                    fp_pct = [d.to_dict() for d in db.collection("fp_percentiles").stream()]
-                    if fp_pct:
-                        f_df = pd.DataFrame(fp_pct).sort_values("Percentile")
-                        ranks["fp_jump_height"] = round(float(np.interp(cmj_athlete["jump_height_m"].values[0], f_df["JumpHeight"].values, f_df["Percentile"].values)), 1)
-                        ranks["fp_mrsi"] = round(float(np.interp(cmj_athlete["mrsi"].values[0], f_df["mRSI"].values, f_df["Percentile"].values)), 1)
-
-                    cmj_df = pd.DataFrame({
-                        "Jump Height (in)": cmj_athlete["jump_height_m"] * 39.3701,
-                        "mRSI": cmj_athlete["mrsi"],
-                        "Peak Rel Prop Power (W/kg)": cmj_athlete["peak_relative_propulsive_power_w_kg"],
-                        "Braking Asymmetry": cmj_athlete["lr_braking_impulse_index"].round(0)
-                    })
-                    cmj_df = cmj_df.where(pd.notnull(cmj_df), None)
-                    metrics["force_plate_cmj"] = cmj_df.to_dict(orient="records")
-
-            if hd_cache["MR"] is None:
-                hd_cache["MR"] = GetTests(typeId="MR", from_="2025-07-23", to_="2025-07-27")
-
-            mr_data = hd_cache["MR"]
-            if not mr_data.empty:
-                mr_athlete = pd.DataFrame()
-                if athlete_hawkin_id and "athlete_id" in mr_data.columns:
-                    mr_athlete = mr_data[mr_data["athlete_id"].astype(str) == str(athlete_hawkin_id)]
-                if mr_athlete.empty and athlete_name and "athlete_name" in mr_data.columns:
-                    mr_athlete = mr_data[mr_data["athlete_name"] == athlete_name]
-                if not mr_athlete.empty:
-                    mr_df = pd.DataFrame({
-                        "Number of Jumps": mr_athlete["number_of_jumps_count"],
-                        "Avg Jump Height (in)": mr_athlete["avg_jump_height_m"] * 39.3701,
-                        "Peak Jump Height (in)": mr_athlete["peak_jump_height_m"] * 39.3701,
-                        "Avg RSI": mr_athlete["avg_rsi"],
-                        "Peak RSI": mr_athlete["peak_rsi"]
-                    })
-                    mr_df = mr_df.where(pd.notnull(mr_df), None)
-                    metrics["force_plate_mr"] = mr_df.to_dict(orient="records")
+        refs = [db.collection("athlete_info").document(uid) for uid in athlete_uids]
+        for snap in db.get_all(refs):
+            info = (snap.to_dict() or {}) if snap.exists else {}
+            if info.get("HawkinID"):
+                hawkin_by_uid[snap.id] = str(info["HawkinID"])
+            if info.get("ValorID"):
+                valor_by_uid[snap.id] = str(info["ValorID"])
+    except Exception as e:
+        print(f"Error reading athlete links: {e}")
+
+    # Fetch HD Data — join by HawkinID (foreign key)
+    try:
+        if hawkin_by_uid:
+            hawkin_ids = list(dict.fromkeys(hawkin_by_uid.values()))
+            cmj_by_hid = tests_for_athletes(db, "CMJ", hawkin_ids)
+            mr_by_hid = tests_for_athletes(db, "MR", hawkin_ids)
+
+            cmj_first = {}
+            for uid, hid in hawkin_by_uid.items():
+                if cmj_by_hid.get(hid):
+                    cmj_first[uid] = cmj_by_hid[hid][0]
+                    results[uid]["force_plate_cmj"] = cmj_display(cmj_by_hid[hid])
+                if mr_by_hid.get(hid):
+                    results[uid]["force_plate_mr"] = mr_display(mr_by_hid[hid])
+
+            # Calculate FP Percentiles (Elite Rank) for every athlete with a CMJ in one pass
+            if cmj_first:
+                fp_table = get_percentile_table(db, "fp_percentiles")
+                for key, col, hd_col in (("fp_jump_height", "JumpHeight", "jump_height_m"), ("fp_mrsi", "mRSI", "mrsi")):
+                    uids = [u for u in cmj_first if cmj_first[u].get(hd_col) is not None]
+                    if col not in fp_table or not uids:
+                        continue
+                    values = [cmj_first[u][hd_col] for u in uids]
+                    for u, r in zip(uids, np.round(fp_table.rank(col, values), 1)):
+                        ranks[u][key] = float(r)
     except Exception as e:
         print(f"Error fetching HD metrics: {e}")
-        
-    # Fetch Valor Movement Data
-    metrics["valor"] = {"Shoulder": 0, "Ankle": 0, "Hip": 0}
+
+    # Valor Movement Data — precomputed event scores, one get_all for the whole set
+    valor_by_vid = {}
     try:
-        if athlete_valor_id:
-            token = get_jwt_token()
-            if token:
-                valor_endpoint = os.environ.get("VALOR_URL", "").strip().strip("\"'")
-                headers = {"Authorization": f"Bearer {token}"}
-                
-                global valor_cache
-                if valor_cache["sessions"] is None:
-                    # Fetch sessions and cache them globally to maintain speed
-                    all_items = []
-                    continuation_token = '""'
-                    for _ in range(3): # Limit to 3 pages to prevent hangs
-                        req_headers = {**headers, 'X-Continuation-Token': continuation_token}
-                        res = requests.get(f"{valor_endpoint}sessions", headers=req_headers)
-                        if res.status_code == 200:
-                            jdata = res.json()
-                            body = jdata.get("body", "[]")
-                            all_items.extend(json.loads(body) if isinstance(body, str) else body)
-                            continuation_token = jdata.get("X-Continuation-Token")
-                            if not continuation_token or continuation_token == "null":
-                                break
-                        else:
-                            break
-                    df_sess = pd.DataFrame(all_items)
-                    if not df_sess.empty and 'Date' in df_sess.columns:
-                        df_sess = df_sess[df_sess['Date'].str.startswith("2025-07-26")]
-                    valor_cache["sessions"] = df_sess
-                
-                sess_df = valor_cache["sessions"]
-                if sess_df is not None and not sess_df.empty:
-                    athlete_sessions = sess_df[sess_df['Athlete ID'].astype(str) == str(athlete_valor_id)]
-                    
-                    def get_score(session_names):
-                        keys = athlete_sessions[athlete_sessions['Session Name'].isin(session_names)]['s3Key'].tolist()
-                        scores = []
-                        for k in keys:
-                            res = requests.get(f"{valor_endpoint}reportData", headers=headers, params={"s3Key": k})
-                            if res.status_code == 200:
-                                jdata = res.json()
-                                body = jdata.get("body", "{}")
-                                # The API returns the body as a stringified JSON, so we must parse it
-                                if isinstance(body, str):
-                                    body = json.loads(body)
-                                scores.append(extract_valor_score(body))
-                        return round(float(np.mean(scores)), 1) if scores else 0
-
-                    metrics["valor"]["Ankle"] = get_score(["Left Regular Ankle Dorsiflexion - Weighted", "Right Regular Ankle Dorsiflexion - Weighted"])
-                    metrics["valor"]["Shoulder"] = get_score(["Left 90-90 Test Unilateral Shoulder IR/ER", "Right 90-90 Test Unilateral Shoulder IR/ER"])
-                    metrics["valor"]["Hip"] = get_score(["Hip Hinge Test"])
+        valor_by_vid = load_scores(db, list(valor_by_uid.values()))
     except Exception as e:
         print(f"Error fetching Valor metrics: {e}")
 
-    metrics["ranks"] = ranks
+    for uid in athlete_uids:
+        results[uid]["valor"] = valor_by_vid.get(valor_by_uid.get(uid), {"Shoulder": 0, "Ankle": 0, "Hip": 0})
+        results[uid]["ranks"] = ranks[uid]
 
     raw_data = {
         "status": "success",
-        "data": metrics
+        "data": results
     }
-    return clean_payload(raw_data)
+    return raw_data
+
+@https_fn.on_call(memory=options.MemoryOption.MB_512, timeout_sec=60, cors=options.CorsOptions(cors_origins="*", cors_methods=["get", "post"]))
+@safe_execute
+def get_athlete_scorecards(req: https_fn.CallableRequest) -> any:
+    """
+    Pre-ranked scorecards (best values, combine/elite ranks, Valor scores) for a list of athletes.
+    One document read per athlete; missing or out-of-date cards are rebuilt on the spot.
+    """
+    from func_scorecards import load_scorecards
+
+    athlete_uids = [u for u in dict.fromkeys(req.data.get("athlete_uids") or []) if u]
+    if not athlete_uids:
+        return {"status": "error", "message": "No athlete_uids provided"}
+
+    raw_data = {
+        "status": "success",
+        "data": load_scorecards(db, athlete_uids)
+    }
+    return raw_data
 
 @https_fn.on_call(memory=options.MemoryOption.GB_1, timeout_sec=120, cors=options.CorsOptions(cors_origins="*", cors_methods=["get", "post"]))
 @safe_execute
@@ -442,17 +419,16 @@ def register_athlete(req: https_fn.CallableRequest) -> any:
     if not email or not password:
         return {"status": "error", "message": "Email and password are required."}
         
-    # Stream all athletes and find a case-insensitive match for the email
-    email_lower = email.lower()
-    docs = db.collection("athlete_info").stream()
+    # Case-insensitive email match via the identity index (one point read). The index can
+    # lag an edit, so the doc's current email must still match.
+    from func_identity import identity_keys, lookup, normalize_key
     athlete_doc = None
     doc_id = None
-    for doc in docs:
-        d = doc.to_dict()
-        doc_email = d.get("email") or d.get("Email")
-        if doc_email and str(doc_email).strip().lower() == email_lower:
-            athlete_doc = d
-            doc_id = doc.id
+    for uid in lookup(db, "email", email):
+        snap = db.collection("athlete_info").document(uid).get()
+        if snap.exists and ("email", normalize_key("email", email)) in identity_keys(snap.to_dict()):
+            athlete_doc = snap.to_dict() or {}
+            doc_id = uid
             break
             
     if not athlete_doc:
@@ -520,37 +496,43 @@ def upload_roster_csv(req: https_fn.CallableRequest) -> any:
         return {"status": "error", "message": "No CSV data provided."}
         
     try:
-        df = pd.read_csv(io.StringIO(csv_text))
-        df = df.where(pd.notnull(df), None)
-        records = df.to_dict(orient="records")
+        from func_roster import parse_roster_csv
+        records = parse_roster_csv(csv_text)
         
-        # Get existing athletes to map Name -> doc_id for upserts (prevents duplicates)
-        existing_docs = db.collection("athlete_info").stream()
-        name_to_id = {doc.to_dict().get("Name"): doc.id for doc in existing_docs if doc.to_dict().get("Name")}
+        # Map the uploaded names -> doc_id for upserts (prevents duplicates) via the identity index
+        from func_identity import index_new, normalize_key, resolve_many
+        name_to_id = resolve_many(db, "name", [r.get("Name") for r in records])
         
         batch = db.batch()
         collection_ref = db.collection("athlete_info")
         count = 0
+        pending = 0
         
         for record in records:
             name = record.get("Name")
             if not name:
                 continue # Skip empty rows
             
-            if name in name_to_id:
+            norm = normalize_key("name", name)
+            if norm in name_to_id:
                 # Update existing athlete
-                doc_ref = collection_ref.document(name_to_id[name])
+                doc_ref = collection_ref.document(name_to_id[norm])
                 batch.set(doc_ref, record, merge=True)
             else:
-                # Create new athlete
+                # Create new athlete, indexed in the same batch so a re-upload finds it
                 doc_ref = collection_ref.document()
                 batch.set(doc_ref, record)
+                pending += index_new(db, batch, doc_ref.id, record)
+                # A repeated name later in the same file updates this new doc
+                name_to_id[norm] = doc_ref.id
                 
             count += 1
+            pending += 1
             # Firestore limits batches to 500 writes
-            if count % 400 == 0:
+            if pending >= 400:
                 batch.commit()
                 batch = db.batch()
+                pending = 0
                 
         batch.commit()
         return {"status": "success", "message": f"Successfully processed {count} roster records."}
@@ -603,30 +585,17 @@ def get_valor_athletes(req: https_fn.CallableRequest) -> any:
     if role not in ["admin", "coach"]:
         return {"status": "error", "message": "Permission denied."}
 
-    jwt = get_jwt_token()
-    valor_url = os.environ.get("VALOR_URL", "").strip().strip("\"'")
-    if not jwt or not valor_url:
+    # Valor roster from the two-tier cache (pass refresh=true to force a fresh pull)
+    from func_valor import athlete_roster
+    roster = athlete_roster(db, refresh=bool(req.data.get("refresh")))
+    if roster is None:
         return {"status": "error", "message": "Valor credentials not configured."}
 
-    response = requests.get(f"{valor_url}/athletes", headers={"Authorization": f"Bearer {jwt}"}, timeout=30)
-    if response.status_code != 200:
-        return {"status": "error", "message": f"Valor API returned {response.status_code}"}
-
-    raw = response.json()
-    athletes = []
-    for a in raw:
-        fn = (a.get("FirstName") or "").strip()
-        ln = (a.get("LastName") or "").strip()
-        aid = str(a.get("AthleteId") or a.get("Id") or "")
-        if fn or ln:
-            athletes.append({"ValorID": aid, "Name": f"{fn} {ln}".strip()})
-
-    # Also load which ValorIDs are already assigned in Firestore
-    assigned_ids = set()
-    for doc in db.collection("athlete_info").stream():
-        vid = doc.to_dict().get("ValorID")
-        if vid:
-            assigned_ids.add(str(vid))
+    athletes = [{"ValorID": a["id"], "Name": a["name"]} for a in roster if a["name"]]
+
+    # Also load which ValorIDs are already assigned in Firestore (identity index point reads)
+    from func_identity import lookup_many
+    assigned_ids = set(lookup_many(db, "valor", [a["ValorID"] for a in athletes]))
 
     for a in athletes:
         a["assigned"] = a["ValorID"] in assigned_ids
@@ -769,47 +738,31 @@ def sync_bookeo_roster(req: https_fn.CallableRequest) -> any:
     bookings = get_bookings(product_id, start_time, end_time)
     bookeo_athletes = extract_athletes(bookings)
 
-    # Load existing athlete_info keyed on bookeo_person_id and by normalized name
-    existing_docs = list(db.collection("athlete_info").stream())
-    existing_by_bookeo_id = {}
-    existing_by_norm_name = {}
-    for doc in existing_docs:
-        d = doc.to_dict()
-        d["_doc_id"] = doc.id
-        bpid = d.get("bookeo_person_id")
-        if bpid:
-            existing_by_bookeo_id[bpid] = d
-        name = d.get("Name", "")
-        if name:
-            existing_by_norm_name[normalize_name(name)] = d
-
-    # Load HD roster for cross-ref
+    # Resolve existing athlete_info docs by bookeo_person_id and by normalized name from the identity index
+    # (confirmed against each doc's current fields, since the index can lag an edit)
+    from func_identity import index_new, resolve_many
+    existing_by_bookeo_id = {bpid: {"_doc_id": uid} for bpid, uid in
+                             resolve_many(db, "bookeo", [a["bookeo_person_id"] for a in bookeo_athletes]).items()}
+    existing_by_norm_name = {norm: {"_doc_id": uid} for norm, uid in
+                             resolve_many(db, "name", [a["Name"] for a in bookeo_athletes]).items()}
+
+    # Load HD roster for cross-ref (two-tier cached)
+    from func_hd import athlete_roster as hd_roster
+    from func_valor import athlete_roster as valor_roster
     hd_by_norm_name = {}
     try:
-        hd_token = os.environ.get("HD_TOKEN", "").strip().strip("\"'")
-        if hd_token:
-            AuthManager(authMethod="manual", refreshToken=hd_token)
-            hd_df = GetAthletes()
-            if not hd_df.empty and "name" in hd_df.columns:
-                for _, row in hd_df.iterrows():
-                    hd_by_norm_name[normalize_name(str(row["name"]))] = str(row["id"])
+        for a in hd_roster(db) or []:
+            if a["name"]:
+                hd_by_norm_name[normalize_name(a["name"])] = a["id"]
     except Exception as e:
         print(f"HD roster fetch failed during sync: {e}")
 
-    # Load Valor roster for cross-ref
+    # Load Valor roster for cross-ref (two-tier cached)
     valor_by_norm_name = {}
     try:
-        jwt = get_jwt_token()
-        valor_url = os.environ.get("VALOR_URL", "").strip().strip("\"'")
-        if jwt and valor_url:
-            resp = requests.get(f"{valor_url}/athletes", headers={"Authorization": f"Bearer {jwt}"}, timeout=30)
-            if resp.status_code == 200:
-                for a in resp.json():
-                    fn = (a.get("FirstName") or "").strip()
-                    ln = (a.get("LastName") or "").strip()
-                    aid = str(a.get("AthleteId") or a.get("Id") or "")
-                    if fn or ln:
-                        valor_by_norm_name[normalize_name(f"{fn} {ln}")] = aid
+        for a in valor_roster(db) or []:
+            if a["name"]:
+                valor_by_norm_name[normalize_name(a["name"])] = a["id"]
     except Exception as e:
         print(f"Valor roster fetch failed during sync: {e}")
 
@@ -821,7 +774,7 @@ def sync_bookeo_roster(req: https_fn.CallableRequest) -> any:
             norm = normalize_name(athlete["Name"])
 
             # Determine Firestore doc to upsert
-            existing = existing_by_bookeo_id.get(bpid) or existing_by_norm_name.get(norm)
+            existing = existing_by_bookeo_id.get(str(bpid)) or existing_by_norm_name.get(norm)
 
             # Cross-ref HD
             hd_id = hd_by_norm_name.get(norm)
@@ -867,10 +820,307 @@ def sync_bookeo_roster(req: https_fn.CallableRequest) -> any:
                 db.collection("athlete_info").document(doc_id).set(doc_data, merge=True)
                 results["matched"] += 1
             else:
-                db.collection("athlete_info").add(doc_data)
+                # Index the new doc in the same batch so a re-run (or a repeat booking) matches it
+                doc_ref = db.collection("athlete_info").document()
+                batch = db.batch()
+                batch.set(doc_ref, doc_data)
+                index_new(db, batch, doc_ref.id, doc_data)
+                batch.commit()
+                existing_by_bookeo_id[str(bpid)] = existing_by_norm_name[norm] = {"_doc_id": doc_ref.id}
                 results["created"] += 1
 
         except Exception as e:
             results["errors"].append(f"{athlete.get('Name', '?')}: {str(e)}")
 
-    return {"status": "success", **results}
\ No newline at end of file
+    return {"status": "success", **results}
+
+
+# ──────────────────────────────────────────────
+# HD / Valor link validation (background)
+# ──────────────────────────────────────────────
+
+@scheduler_fn.on_schedule(schedule="every 6 hours", memory=options.MemoryOption.GB_1, timeout_sec=300)
+def validate_external_links(event: scheduler_fn.ScheduledEvent) -> None:
+    """Periodically check stored HawkinID/ValorID links still resolve in HD and Valor."""
+    from func_links import validate_links
+    summary = validate_links(db)
+    print(f"Link validation: {summary['updated']} athletes updated, "
+          f"{len(summary['hd_broken'])} broken HD links, {len(summary['valor_broken'])} broken Valor links")
+
+
+@https_fn.on_call(memory=options.MemoryOption.GB_1, timeout_sec=300, cors=options.CorsOptions(cors_origins="*", cors_methods=["get", "post"]))
+@safe_execute
+def run_link_validation(req: https_fn.CallableRequest) -> any:
+    """Admin-triggered run of the link validation job."""
+    caller_uid, err = _require_staff(req)
+    if err:
+        return err
+    caller = firebase_auth.get_user(caller_uid)
+    if (caller.custom_claims or {}).get("role") != "admin":
+        return {"status": "error", "message": "Admin only."}
+
+    from func_links import validate_links
+    summary = validate_links(db)
+    return {"status": "success", **summary}
+
+
+# ──────────────────────────────────────────────
+# Hawkin Dynamics test sync (background)
+# ──────────────────────────────────────────────
+
+def _run_hd_sync() -> dict:
+    from func_hd import sync_tests
+    from func_clients import clients
+    if not clients.ensure_hd_auth():
+        return {"status": "error", "message": "HD_TOKEN not configured."}
+    from func_scorecards import recompute_scorecards, uids_for_links
+    counts = sync_tests(db)
+    hawkin_ids = counts.pop("athlete_ids", [])
+    print(f"HD sync: {counts}")
+    if hawkin_ids:
+        uids = uids_for_links(db, "HawkinID", hawkin_ids)
+        recompute_scorecards(db, uids)
+        print(f"HD sync: refreshed {len(uids)} scorecards")
+    return {"status": "success", "synced": counts}
+
+
+@scheduler_fn.on_schedule(schedule="every 15 minutes", memory=options.MemoryOption.MB_512, timeout_sec=300)
+def sync_hd_tests(event: scheduler_fn.ScheduledEvent) -> None:
+    """Incrementally pull new HD CMJ/MR tests for the event window into hd_tests."""
+    _run_hd_sync()
+
+
+@https_fn.on_call(memory=options.MemoryOption.MB_512, timeout_sec=300, cors=options.CorsOptions(cors_origins="*", cors_methods=["get", "post"]))
+@safe_execute
+def run_hd_sync(req: https_fn.CallableRequest) -> any:
+    """Admin-triggered run of the HD test sync."""
+    caller_uid, err = _require_staff(req)
+    if err:
+        return err
+    caller = firebase_auth.get_user(caller_uid)
+    if (caller.custom_claims or {}).get("role") != "admin":
+        return {"status": "error", "message": "Admin only."}
+    return _run_hd_sync()
+
+
+# ──────────────────────────────────────────────
+# Valor session sync (background)
+# ──────────────────────────────────────────────
+
+def _run_valor_sync() -> dict:
+    from func_valor import sync_sessions, precompute_scores, VALOR_RUN_BUDGET_SECONDS
+    deadline = time.monotonic() + VALOR_RUN_BUDGET_SECONDS
+    token = get_jwt_token()
+    valor_endpoint = os.environ.get("VALOR_URL", "").strip().strip("\"'")
+    if not token or not valor_endpoint:
+        return {"status": "error", "message": "Valor credentials not configured."}
+    result = sync_sessions(db, valor_endpoint, {"Authorization": f"Bearer {token}"})
+    print(f"Valor session sync: {result}")
+    # Score the event once the session index is complete; already-cached reports cost nothing
+    if result["complete"]:
+        from func_scorecards import recompute_scorecards, uids_for_links
+        scores = precompute_scores(db, deadline=deadline)
+        changed = scores.pop("changed")
+        if changed:
+            recompute_scorecards(db, uids_for_links(db, "ValorID", changed))
+        result["scores"] = {**scores, "changed": len(changed)}
+        print(f"Valor score precompute: {result['scores']}")
+    return {"status": "success", **result}
+
+
+@scheduler_fn.on_schedule(schedule="every 15 minutes", memory=options.MemoryOption.MB_512, timeout_sec=540)
+def sync_valor_sessions(event: scheduler_fn.ScheduledEvent) -> None:
+    """Incrementally pull Valor sessions (all pages) into valor_sessions, then rescore the event."""
+    _run_valor_sync()
+
+
+@https_fn.on_call(memory=options.MemoryOption.MB_512, timeout_sec=540, cors=options.CorsOptions(cors_origins="*", cors_methods=["get", "post"]))
+@safe_execute
+def run_valor_sync(req: https_fn.CallableRequest) -> any:
+    """Admin-triggered run of the Valor session sync."""
+    caller_uid, err = _require_staff(req)
+    if err:
+        return err
+    caller = firebase_auth.get_user(caller_uid)
+    if (caller.custom_claims or {}).get("role") != "admin":
+        return {"status": "error", "message": "Admin only."}
+    return _run_valor_sync()
+
+
+# ──────────────────────────────────────────────
+# Event pre-warm (background)
+# ──────────────────────────────────────────────
+
+# Cadence of the pre-warm job, and how long before the HD event window it starts running
+PREWARM_SCHEDULE = os.environ.get("PREWARM_SCHEDULE", "").strip().strip("\"'") or "every 30 minutes"
+PREWARM_LEAD_HOURS = float(os.environ.get("PREWARM_LEAD_HOURS", "").strip().strip("\"'") or 12)
+
+
+def _in_prewarm_window() -> bool:
+    from func_hd import event_window
+    start, end = event_window()
+    now = datetime.datetime.now(datetime.timezone.utc).timestamp()
+    return start - PREWARM_LEAD_HOURS * 3600 <= now <= end
+
+
+def _run_prewarm() -> dict:
+    """Fill every derived view and shared cache the hub reads.
+
+    The HD and Valor syncs stay on their own schedules: running them here too would let
+    two crawls of the same source overlap and race on the sync watermarks.
+    """
+    from func_percentiles import PERCENTILE_TABLES, get_compiled
+    from func_roster import load_view, rebuild_view
+    from func_identity import ensure_index
+    from func_hd import athlete_roster as hd_roster
+    from func_valor import athlete_roster as valor_roster
+    from func_scorecards import load_scorecards
+
+    steps = {}
+
+    def step(name, fn):
+        try:
+            steps[name] = fn()
+        except Exception as e:
+            print(f"Pre-warm {name} failed: {e}")
+            steps[name] = {"status": "error", "message": str(e)}
+
+    def warm_percentiles():
+        for name in PERCENTILE_TABLES:
+            get_compiled(db, name)
+        return len(PERCENTILE_TABLES)
+
+    def warm_identity_index():
+        ensure_index(db)
+        return "ok"
+
+    view = {}
+
+    def warm_view():
+        nonlocal view
+        view = load_view(db)
+        if view is None:
+            view = rebuild_view(db)
+        return len(view)
+
+    def warm_scorecards():
+        # Rebuilds only cards that are missing or ranked against an old percentile version
+        uids = [uid for uid, entry in view.items() if entry.get("profile") is not None]
+        return len(load_scorecards(db, uids))
+
+    step("percentiles", warm_percentiles)
+    step("identity_index", warm_identity_index)
+    step("hd_roster", lambda: len(hd_roster(db, refresh=True) or []))
+    step("valor_roster", lambda: len(valor_roster(db, refresh=True) or []))
+    step("roster_view", warm_view)
+    step("scorecards", warm_scorecards)
+
+    print(f"Pre-warm: {steps}")
+    return {"status": "success", "steps": steps}
+
+
+@scheduler_fn.on_schedule(schedule=PREWARM_SCHEDULE, memory=options.MemoryOption.GB_1, timeout_sec=540)
+def prewarm_event(event: scheduler_fn.ScheduledEvent) -> None:
+    """Keep views and shared caches warm from PREWARM_LEAD_HOURS before the event until it ends."""
+    if not _in_prewarm_window():
+        return
+    _run_prewarm()
+
+
+@https_fn.on_call(memory=options.MemoryOption.GB_1, timeout_sec=540, cors=options.CorsOptions(cors_origins="*", cors_methods=["get", "post"]))
+@safe_execute
+def run_prewarm(req: https_fn.CallableRequest) -> any:
+    """Admin-triggered pre-warm, regardless of the event window."""
+    caller_uid, err = _require_staff(req)
+    if err:
+        return err
+    caller = firebase_auth.get_user(caller_uid)
+    if (caller.custom_claims or {}).get("role") != "admin":
+        return {"status": "error", "message": "Admin only."}
+    return _run_prewarm()
+
+
+# ──────────────────────────────────────────────
+# Roster view maintenance (Firestore triggers)
+# ──────────────────────────────────────────────
+
+def _snapshot_dict(snap):
+    """Return a written snapshot's data, or None if the doc doesn't exist on that side."""
+    if snap is None or not snap.exists:
+        return None
+    return snap.to_dict() or {}
+
+
+@firestore_fn.on_document_written(document="athlete_info/{athleteId}")
+def on_athlete_info_written(event: firestore_fn.Event[firestore_fn.Change[firestore_fn.DocumentSnapshot | None]]) -> None:
+    """Keep the roster view's profile entry, the identity index and the athlete's scorecard
+    in sync with athlete_info.
+
+    Triggers are at-least-once and unordered, so the doc is re-read and its current state
+    written rather than event.data.after: a late delivery of an older edit then rewrites
+    the latest profile instead of rolling the view and the index back.
+    """
+    from func_roster import upsert_profile, remove_athlete, refresh_metric_flags
+    from func_identity import apply_change
+
+    athlete_uid = event.params["athleteId"]
+    before = _snapshot_dict(event.data.before)
+    after = _snapshot_dict(db.collection("athlete_info").document(athlete_uid).get())
+    if after is None:
+        from func_scorecards import delete_scorecard
+        remove_athlete(db, athlete_uid)
+        delete_scorecard(db, athlete_uid)
+    else:
+        upsert_profile(db, athlete_uid, after)
+        if before is None:
+            # Metric-flag writes skip athletes without a profile, so pick up earlier rows now
+            refresh_metric_flags(db, athlete_uid)
+        # HD/Valor data is joined through HawkinID/ValorID, so a fixed or added link
+        # must rebuild the card rather than wait for the next percentile version
+        if any((before or {}).get(f) != after.get(f) for f in ("Name", "HawkinID", "ValorID")):
+            from func_scorecards import recompute_scorecards
+            recompute_scorecards(db, [athlete_uid])
+    apply_change(db, athlete_uid, before, after)
+
+
+def _refresh_metric_flags(collection: str, event):
+    """A metric row changed: refresh the presence flag and scorecard for the athlete(s) it belongs to."""
+    from func_roster import refresh_metric_flag
+
+    uids = set()
+    for snap in (event.data.before, event.data.after):
+        d = _snapshot_dict(snap)
+        if d and d.get("athlete_uid"):
+            uids.add(d["athlete_uid"])
+    for uid in uids:
+        refresh_metric_flag(db, collection, uid)
+    if uids:
+        from func_scorecards import recompute_scorecards
+        recompute_scorecards(db, sorted(uids))
+
+
+@firestore_fn.on_document_written(document="sprint40/{docId}")
+def on_sprint40_written(event: firestore_fn.Event[firestore_fn.Change[firestore_fn.DocumentSnapshot | None]]) -> None:
+    _refresh_metric_flags("sprint40", event)
+
+
+@firestore_fn.on_document_written(document="pro_agility/{docId}")
+def on_pro_agility_written(event: firestore_fn.Event[firestore_fn.Change[firestore_fn.DocumentSnapshot | None]]) -> None:
+    _refresh_metric_flags("pro_agility", event)
+
+
+@firestore_fn.on_document_written(document="standing_vert/{docId}")
+def on_standing_vert_written(event: firestore_fn.Event[firestore_fn.Change[firestore_fn.DocumentSnapshot | None]]) -> None:
+    _refresh_metric_flags("standing_vert", event)
+
+
+@firestore_fn.on_document_written(document="broad_jump/{docId}")
+def on_broad_jump_written(event: firestore_fn.Event[firestore_fn.Change[firestore_fn.DocumentSnapshot | None]]) -> None:
+    _refresh_metric_flags("broad_jump", event)
+
+
+@firestore_fn.on_document_written(document="standing_reach/{athleteId}")
+def on_standing_reach_written(event: firestore_fn.Event[firestore_fn.Change[firestore_fn.DocumentSnapshot | None]]) -> None:
+    """Standing reach is shown on the scorecard; the vert it feeds arrives via standing_vert."""
+    from func_scorecards import recompute_scorecards
+    recompute_scorecards(db, [event.params["athleteId"]])
@@ -4,6 +4,7 @@ import seaborn as sns
 import numpy as np
 import streamlit as st
 import plotly.graph_objects as go
+from functions.func_percentiles import PercentileTable
 
 
 #--------------------------------------------------------------------------------------------#
@@ -49,7 +50,8 @@ def set_combine_theme():
         "savefig.bbox": "tight"
     })
 
-def percentile_strip_plot_from_table(value: int | float, metric: str, table: pd.DataFrame, metric_label: str = None, title: str = None):
+def percentile_strip_plot_from_table(value: int | float, metric: str, table: pd.DataFrame, metric_label: str = None, title: str = None,
+                                     compiled: PercentileTable = None):
     """
     Create a horizontal percentile strip plot for a test result value.
 
@@ -59,6 +61,8 @@ def percentile_strip_plot_from_table(value: int | float, metric: str, table: pd.
     - table: a DataFrame with 'percentile' and metric columns
     - metric_label: custom label for x-axis (optional)
     - title: custom chart title (optional)
+    - compiled: the table already compiled once, e.g. data.CombineTable / data.ForcePlateTable
+      (optional; compiled from `table` on each call otherwise)
 
     Returns:
     - Matplotlib figure object
@@ -73,16 +77,13 @@ def percentile_strip_plot_from_table(value: int | float, metric: str, table: pd.
     fig, ax = plt.subplots(figsize=(8, 2.5))
 
     p_values = df_sorted[metric].values
-    p_percentiles = df_sorted["Percentile"].values
+    ref_table = compiled if compiled is not None and metric in compiled else PercentileTable(df_sorted)
 
-    # Reverse axis if lower is better but keep bar growing left to right
-    reverse = metric in ["Sprint40", "ProAgility"]
-    if reverse:
-        p_values = p_values[::-1]
-        p_percentiles = p_percentiles[::-1]
+    # Reverse axis if lower is better (LOWER_IS_BETTER) but keep bar growing left to right
+    reverse = ref_table.lower_is_better(metric)
 
     # Estimate percentile rank
-    est_percentile = float(np.interp(value, p_values, p_percentiles))
+    est_percentile = float(ref_table.rank(metric, [value])[0])
 
     # Color tier
     if est_percentile <= 40:
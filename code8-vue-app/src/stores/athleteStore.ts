@@ -9,6 +9,8 @@ export interface RosterItem {
   SprintID: string | null;
   ProAgilID: string | null;
   ValorID: string | null;
+  HawkinLink?: 'ok' | 'broken' | 'unlinked' | null; // Set by the background link validation job
+  ValorLink?: 'ok' | 'broken' | 'unlinked' | null;
   athlete_uid?: string | null; // Future-proofing for when we pull the DB UUID
   Email?: string | null;
   BirthDate?: string | null;
@@ -22,6 +24,24 @@ export interface RosterItem {
   CurrentSchool?: string | null;
 }
 
+interface ColumnarRoster {
+  count: number;
+  columns: string[];
+  data: Record<string, any[]>;
+  dictionaries?: Record<string, any[]>;
+}
+
+interface RosterResponse {
+  status: string;
+  data: any;
+  format?: string;
+  mode?: 'full' | 'delta' | 'unchanged';
+  version?: number;
+  deleted?: string[];
+  message?: string;
+  traceback?: string;
+}
+
 export const useAthleteStore = defineStore('athlete', () => {
   // State
   const roster = ref<RosterItem[]>([]);
@@ -31,9 +51,61 @@ export const useAthleteStore = defineStore('athlete', () => {
   const metrics = ref<any>(null); // State to hold the detailed Firestore records
   const metricsLoading = ref(false);
   const metricsCache = ref<Record<string, any>>({}); // Cache to make switching athletes instant
+  const rosterVersion = ref<number | null>(null); // roster_view version the loaded roster reflects
   let currentRequestId = 0; // Race condition lock
 
   // Actions
+  // get_roster's columnar format: field names once, dictionary-encoded low-cardinality fields
+  const decodeColumnar = (body: ColumnarRoster): RosterItem[] => {
+    const rows = Array.from({ length: body.count }, () => ({} as Record<string, any>));
+    for (const col of body.columns) {
+      const values = body.data[col];
+      const dict = body.dictionaries?.[col];
+      for (let i = 0; i < body.count; i++) {
+        const v = values[i];
+        rows[i][col] = dict && v !== null ? dict[v] : v;
+      }
+    }
+    return rows as RosterItem[];
+  };
+
+  // Applies a get_roster response; returns false (and sets error) if the backend failed
+  const applyRosterResponse = (responseData: RosterResponse): boolean => {
+    if (responseData.status !== 'success') {
+      error.value = responseData.message || 'Failed to load roster data.';
+      console.error("Backend returned error:", responseData.message);
+      if (responseData.traceback) {
+        console.error("Backend Traceback:\n", responseData.traceback);
+      }
+      return false;
+    }
+    if (responseData.version !== undefined) rosterVersion.value = responseData.version;
+    if (responseData.mode === 'unchanged') return true;
+
+    const records: RosterItem[] = responseData.format === 'columnar'
+      ? decodeColumnar(responseData as unknown as ColumnarRoster)
+      : responseData.data;
+
+    if (responseData.mode === 'delta') {
+      // Merge changed athletes into the loaded roster and drop deleted ones
+      const byUid = new Map(roster.value.map(a => [a.athlete_uid, a]));
+      for (const uid of responseData.deleted || []) byUid.delete(uid);
+      for (const r of records) byUid.set(r.athlete_uid, r);
+      roster.value = [...byUid.values()].sort((a, b) => a.Name.localeCompare(b.Name));
+    } else {
+      roster.value = records;
+    }
+    return true;
+  };
+
+  const requestRoster = async (sinceVersion: number | null) => {
+    const getRoster = httpsCallable(functions, 'get_roster');
+    const payload: Record<string, any> = { format: 'columnar' };
+    if (sinceVersion !== null) payload.since_version = sinceVersion;
+    const result = await getRoster(payload);
+    return applyRosterResponse(result.data as RosterResponse);
+  };
+
   const fetchRoster = async () => {
     if (roster.value.length > 0) return; // Prevent re-fetching if already loaded
 
@@ -41,19 +113,7 @@ export const useAthleteStore = defineStore('athlete', () => {
     error.value = null;
 
     try {
-      const getRoster = httpsCallable(functions, 'get_roster');
-      const result = await getRoster();
-      const responseData = result.data as { status: string; data: RosterItem[], message?: string, traceback?: string };
-
-      if (responseData.status === 'success') {
-        roster.value = responseData.data;
-      } else {
-        error.value = responseData.message || 'Failed to load roster data.';
-        console.error("Backend returned error:", responseData.message);
-        if (responseData.traceback) {
-          console.error("Backend Traceback:\n", responseData.traceback);
-        }
-      }
+      await requestRoster(null);
     } catch (err: any) {
       console.error("Error fetching roster:", err);
       error.value = err.message || 'An error occurred while fetching the roster.';
@@ -62,8 +122,29 @@ export const useAthleteStore = defineStore('athlete', () => {
     }
   };
 
+  // Conditional refetch: only athletes changed since the loaded version (or nothing) come back
+  const syncRoster = async () => {
+    if (roster.value.length === 0 || rosterVersion.value === null) {
+      await fetchRoster();
+      return;
+    }
+    try {
+      await requestRoster(rosterVersion.value);
+    } catch (err: any) {
+      console.error("Error syncing roster:", err);
+    }
+  };
+
+  // Keeps a station tablet's roster current during an event; returns a stop function
+  const startRosterPolling = (intervalMs = 30000) => {
+    syncRoster();
+    const timer = setInterval(syncRoster, intervalMs);
+    return () => clearInterval(timer);
+  };
+
   const forceRefreshRoster = async () => {
     roster.value = [];
+    rosterVersion.value = null;
     metricsCache.value = {};
     await fetchRoster();
   };
@@ -112,6 +193,6 @@ export const useAthleteStore = defineStore('athlete', () => {
 
   return {
     roster, selectedAthlete, loading, error, metrics, metricsLoading,
-    fetchRoster, forceRefreshRoster, selectAthlete, fetchAthleteMetrics
+    fetchRoster, forceRefreshRoster, syncRoster, startRosterPolling, selectAthlete, fetchAthleteMetrics
   };
 });
\ No newline at end of file
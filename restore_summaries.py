@@ -1,27 +1,27 @@
+import os
+import sys
 import pandas as pd
 from firebase_admin import initialize_app, firestore, credentials
 from dateutil import parser
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "code8-vue-app", "functions"))
+from func_identity import lookup_many, normalize_key
+
 # 1. Initialize Firebase Admin
 cred = credentials.Certificate(r"C:\src\code8\slo-combine\code8-vue-app\service-account.json")
 initialize_app(cred)
 db = firestore.client()
 
-# 2. Fetch current Athlete Mapping so we can inject the correct athlete_uid
-print("Fetching active athlete mapping from Firestore...")
-docs = db.collection('athlete_info').stream()
-mapping = {}
-for doc in docs:
-    data = doc.to_dict()
-    if 'Name' in data:
-        mapping[data['Name']] = doc.id
-
-# 3. Read the extracted CSV
+# 2. Read the extracted CSV
 print("Reading legacy summaries CSV...")
 csv_path = r"C:\src\code8\slo-combine\data\athlete_summaries.csv"
 df = pd.read_csv(csv_path)
 df = df.where(pd.notnull(df), None) # Handle NaN values cleanly
 
+# 3. Resolve the CSV's athlete names through the identity index so we can inject the correct athlete_uid
+print("Fetching athlete mapping from the identity index...")
+mapping = {key: uids[0] for key, uids in lookup_many(db, "name", df['athlete_name'].dropna().unique()).items()}
+
 # 4. Batch Upload to Firestore
 batch = db.batch()
 collection_ref = db.collection('athlete_summaries')
@@ -36,7 +36,7 @@ for _, row in df.iterrows():
         
     record = {
         "athlete_name": athlete_name,
-        "athlete_uid": mapping.get(athlete_name), # Link to the new Firestore UUID!
+        "athlete_uid": mapping.get(normalize_key("name", athlete_name)), # Link to the new Firestore UUID!
         "author": "Supabase Legacy",
         "summary_html": summary_html,
         "created_at": parser.parse(str(row['created_at'])) if row.get('created_at') else firestore.SERVER_TIMESTAMP
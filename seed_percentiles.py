@@ -26,4 +26,10 @@ def upload_percentiles(csv_path, collection_name):
 upload_percentiles(r"C:\src\code8\slo-combine\data\combinePercentiles.csv", 'combine_percentiles')
 upload_percentiles(r"C:\src\code8\slo-combine\data\ForcePlatesPercentiles.csv", 'fp_percentiles')
 upload_percentiles(r"C:\src\code8\slo-combine\data\nflCombineforceplatePercentiles.csv", 'nfl_fp_percentiles')
+
+# Bump the version stamp so warm Cloud Function instances drop their cached tables
+db.collection('meta').document('percentiles').set({
+    "version": firestore.Increment(1),
+    "updated_at": firestore.SERVER_TIMESTAMP,
+}, merge=True)
 print("Percentiles seeded successfully!")
\ No newline at end of file